@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# memory held per scraped tweet, e.g. by a RECURSE crawl that keeps every Tweet alive.
+'''
+usage (from the repository root):
+    python -m benchmarks.memory --tweets 50000
+
+Pages are rebuilt from the checked in *_convo.json dumps (see benchmarks.synthetic), decoded and parsed
+into Tweet objects (or serialized dicts with --fast-path); the pages are dropped and only the tweets are kept,
+like a crawl does. Reports the traced bytes per tweet, the size of the Tweet/User objects themselves and the
+pickled size per tweet (what BackupStore writes).
+'''
+import gc
+import sys
+import json
+import pickle
+import argparse
+import tracemalloc
+from typing import List, Dict
+from benchmarks import synthetic
+from benchmarks.pipeline import DUMPS
+from yats.raw import RawTweetSerializer
+from yats.tokens import GuestTokenPool
+from yats.snscrape import TwitterAPIScraper
+
+
+def build(conversations: Dict[str, List[dict]], num_tweets: int, fast_path: bool=False) -> list:
+    scraper = TwitterAPIScraper("https://twitter.com", guestTokenPool=GuestTokenPool(path=None), tweetFactory=RawTweetSerializer() if fast_path else None)
+    tweets = []
+    for conversation in synthetic.scale(conversations, num_tweets):
+        for page in synthetic.api_pages(conversation):
+            page = json.loads(json.dumps(page, ensure_ascii=False))
+            tweets += scraper._instructions_to_tweets(page, includeConversationThreads=True)
+    return tweets
+
+def _shallow_size(objects: list) -> int:
+    '''size of the distinct objects and of their __dict__s, if they have one.'''
+    size = 0
+    for obj in {id(obj): obj for obj in objects}.values():
+        size += sys.getsizeof(obj)
+        if hasattr(obj, "__dict__"):
+            size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="memory held per scraped tweet.")
+    parser.add_argument("--tweets", type=int, default=50_000)
+    parser.add_argument("--dumps", nargs="*", default=DUMPS, help="*_convo.json files the synthetic pages are rebuilt from.")
+    parser.add_argument("--fast-path", action="store_true", help="keep serialized dicts (RawTweetSerializer) instead of Tweet objects.")
+    args = parser.parse_args(argv)
+
+    # the dumps are loaded before tracing starts, they aren't part of what a crawl keeps.
+    conversations = synthetic.load(args.dumps)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tweets = build(conversations, args.tweets, fast_path=args.fast_path)
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    print(f"{len(tweets)} {'serialized tweets' if args.fast_path else 'Tweet objects'}")
+    print(f"traced bytes per tweet: {held / len(tweets):,.0f}")
+    if not args.fast_path:
+        tweet_size = _shallow_size(tweets) / len(tweets)
+        users = [tweet.user for tweet in tweets]
+        user_size = _shallow_size(users) / len({id(user) for user in users})
+        print(f"per Tweet object (+ __dict__): {tweet_size:,.0f} B, per User object (+ __dict__): {user_size:,.0f} B")
+    print(f"pickled bytes per tweet: {len(pickle.dumps(tweets[:10000])) / min(len(tweets), 10000):,.0f}")
+
+
+if __name__ == "__main__":
+    main()
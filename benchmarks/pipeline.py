@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# offline micro-benchmark of the decode -> parse -> serialize -> tree -> dialogue -> json path.
+'''
+usage (from the repository root):
+    python -m benchmarks.pipeline --tweets 100000
+    python -m benchmarks.pipeline --tweets 1000000 --memory
+    python -m benchmarks.pipeline --tweets 100000 --fast-path
+    python -m benchmarks.pipeline --recordings responses/ --tweets 100000
+
+Without --recordings, API pages are rebuilt from the checked in *_convo.json dumps (see benchmarks.synthetic)
+and the conversations are copied with fresh ids until --tweets tweets are reached. With --recordings, the
+responses stored in a yats.cache.ResponseCache folder are replayed instead. No network access is needed.
+Conversations are streamed, so memory stays bounded by one conversation whatever --tweets is.
+'''
+import io
+import os
+import sys
+import json
+import glob
+import gzip
+import time
+import argparse
+import resource
+import tracemalloc
+from typing import List, Dict, Iterator, Callable
+from benchmarks import synthetic
+from yats import TweetSerializer
+from yats.tree import buildTree, iter_dialogues
+from yats.raw import RawTweetSerializer
+from yats.stream import JSONListWriter
+from yats.tokens import GuestTokenPool
+from yats.snscrape import TwitterAPIScraper
+
+DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+DUMPS = sorted(glob.glob(os.path.join(DIR, "*_convo.json")))
+STAGES = ("decode", "parse", "serialize", "tree", "dialogues", "json")
+
+
+class Stage:
+    '''accumulated wall time, input bytes and peak traced memory of one pipeline stage.'''
+    def __init__(self, name: str):
+        self.name = name
+        self.seconds = 0.0
+        self.bytes = 0
+        self.peak = 0
+
+    def run(self, fn: Callable, *args, nbytes: int=0):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            # restarting the trace resets the peak (tracemalloc.reset_peak needs python 3.9),
+            # only what the stage allocates is traced.
+            tracemalloc.stop()
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = fn(*args)
+        self.seconds += time.perf_counter() - start
+        if tracing:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+        self.bytes += nbytes
+        return result
+
+
+def synthetic_workload(paths: List[str], num_tweets: int) -> Iterator[List[bytes]]:
+    '''encoded API pages, one list per conversation.'''
+    for conversation in synthetic.scale(synthetic.load(paths), num_tweets):
+        yield [json.dumps(page, ensure_ascii=False).encode("utf-8") for page in synthetic.api_pages(conversation)]
+
+def recorded_workload(folder: str, num_tweets: int) -> Iterator[List[bytes]]:
+    '''encoded API pages of a ResponseCache folder, grouped by endpoint (i.e. by conversation), replayed
+    until `num_tweets` timeline entries were produced.'''
+    groups = {}
+    for path in sorted(glob.glob(os.path.join(folder, "*", "*.json.gz"))):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            record = json.load(f)
+        if "globalObjects" in record["response"]:
+            groups.setdefault(record["endpoint"], []).append(json.dumps(record["response"], ensure_ascii=False).encode("utf-8"))
+    if not groups:
+        raise SystemExit(f"no recorded timeline pages in {folder}")
+    produced = 0
+    while produced < num_tweets:
+        for pages in groups.values():
+            if produced >= num_tweets:
+                return
+            produced += sum(page.count(b'"entryId": "tweet-') + page.count(b'"entryId": "sq-I-t-') for page in pages)
+            yield pages
+
+def _closed(tweets: List[dict]) -> List[dict]:
+    '''buildTree needs every parent in the conversation; replies to tweets outside the sample become roots.'''
+    ids = {tweet["id"] for tweet in tweets}
+    return [tweet if tweet["in_reply_to_tweet_id"] in ids or tweet["in_reply_to_tweet_id"] is None
+            else dict(tweet, in_reply_to_tweet_id=None) for tweet in tweets]
+
+def _dialogues(tree: Dict) -> List[List[str]]:
+    # the walk main.extract_dialogues runs.
+    return [dialogue for dialogue in iter_dialogues(tree) if len(dialogue) > 1]
+
+def _write(writer: JSONListWriter, dialogues: List[List[str]]):
+    for dialogue in dialogues:
+        writer.write(dialogue)
+
+
+def run(workload: Iterator[List[bytes]], memory: bool=False, fast_path: bool=False) -> Dict:
+    # with the fast path, parse already yields serialized tweets and serialize has nothing left to do.
+    scraper = TwitterAPIScraper("https://twitter.com", guestTokenPool=GuestTokenPool(path=None), tweetFactory=RawTweetSerializer() if fast_path else None)
+    serializer = TweetSerializer()
+    stages = {name: Stage(name) for name in STAGES}
+    sink = io.StringIO()
+    writer = JSONListWriter(sink, indent=4, ensure_ascii=False)
+    counts = dict(tweets=0, conversations=0, dialogues=0)
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    for pages in workload:
+        tweets = []
+        for page in pages:
+            obj = stages["decode"].run(json.loads, page, nbytes=len(page))
+            tweets += stages["parse"].run(lambda: list(scraper._instructions_to_tweets(obj, includeConversationThreads=True)), nbytes=len(page))
+        serialized = stages["serialize"].run(lambda: [tweet if isinstance(tweet, dict) else serializer(tweet) for tweet in tweets])
+        serialized = _closed(serialized)
+        tree = stages["tree"].run(buildTree, serialized)
+        dialogues = stages["dialogues"].run(_dialogues, tree)
+        offset = sink.tell()
+        stages["json"].run(_write, writer, dialogues)
+        stages["json"].bytes += sink.tell() - offset
+        # the output is only measured, not kept.
+        sink.seek(0)
+        sink.truncate()
+        counts["tweets"] += len(tweets)
+        counts["conversations"] += 1
+        counts["dialogues"] += len(dialogues)
+    total = time.perf_counter() - start
+    if memory:
+        tracemalloc.stop()
+    return dict(stages=stages, total=total, **counts)
+
+def report(result: Dict, memory: bool=False, f=sys.stdout):
+    tweets = result["tweets"]
+    print(f"{tweets} tweets, {result['conversations']} conversations, {result['dialogues']} dialogues in {result['total']:.2f}s", file=f)
+    header = f"{'stage':<10} {'seconds':>9} {'tweets/s':>12} {'MB/s':>9}"
+    if memory:
+        header += f" {'peak MB':>9}"
+    print(header, file=f)
+    for stage in result["stages"].values():
+        line = f"{stage.name:<10} {stage.seconds:>9.3f} {tweets / stage.seconds if stage.seconds else 0:>12,.0f}"
+        line += f" {stage.bytes / 2**20 / stage.seconds:>9.1f}" if stage.bytes and stage.seconds else f" {'-':>9}"
+        if memory:
+            line += f" {stage.peak / 2**20:>9.2f}"
+        print(line, file=f)
+    # ru_maxrss is in KiB on linux.
+    print(f"peak rss: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10:.1f} MB", file=f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="offline benchmark of the tweet processing pipeline.")
+    parser.add_argument("--tweets", type=int, default=100_000, help="number of tweets to push through the pipeline.")
+    parser.add_argument("--dumps", nargs="*", default=DUMPS, help="*_convo.json files the synthetic pages are rebuilt from.")
+    parser.add_argument("--recordings", default=None, help="ResponseCache folder to replay instead of synthetic pages.")
+    parser.add_argument("--memory", action="store_true", help="trace the peak memory of every stage (slower).")
+    parser.add_argument("--fast-path", action="store_true", help="parse with yats.raw.RawTweetSerializer instead of Tweet objects + TweetSerializer.")
+    args = parser.parse_args(argv)
+
+    if args.recordings:
+        workload = recorded_workload(args.recordings, args.tweets)
+    else:
+        workload = synthetic_workload(args.dumps, args.tweets)
+    report(run(workload, memory=args.memory, fast_path=args.fast_path), memory=args.memory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# synthetic twitter API pages rebuilt from serialized conversations (*_convo.json), for offline benchmarks.
+import json
+import datetime
+import itertools
+from typing import List, Dict, Iterator
+
+PAGE_SIZE = 20 # tweets per page, like the conversation endpoint.
+_ID_BASE = 1_400_000_000_000_000_000
+
+
+def load(paths: List[str]) -> Dict[str, List[dict]]:
+    '''conversation_id -> serialized tweets, merged over several *_convo.json files.'''
+    conversations = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            conversations.update(json.load(f))
+    return conversations
+
+def scale(conversations: Dict[str, List[dict]], num_tweets: int) -> Iterator[List[dict]]:
+    '''yield copies of the conversations until `num_tweets` tweets were produced.
+    every copy gets fresh, dense tweet ids (that fit in an int64), so the copies form independent trees.'''
+    produced = 0
+    for copy in itertools.count():
+        ids = {}
+        def remap(tweet_id):
+            if tweet_id is None:
+                return None
+            return ids.setdefault(tweet_id, _ID_BASE + copy * 10**9 + len(ids))
+        for conversation in conversations.values():
+            if produced >= num_tweets:
+                return
+            conversation = conversation[:num_tweets - produced]
+            out = []
+            for tweet in conversation:
+                tweet = dict(tweet)
+                tweet["id"] = remap(tweet["id"])
+                tweet["conversation_id"] = remap(tweet["conversation_id"])
+                tweet["in_reply_to_tweet_id"] = remap(tweet["in_reply_to_tweet_id"])
+                if tweet["quoted_tweet"]:
+                    tweet["quoted_tweet"] = dict(tweet["quoted_tweet"], id=remap(tweet["quoted_tweet"]["id"]))
+                out.append(tweet)
+            produced += len(out)
+            yield out
+        if not conversations:
+            return
+
+def _created_at(datedict: dict) -> str:
+    date = datetime.datetime.strptime(
+        f"{datedict['date']} {datedict['time']} {datedict['utc_offset']}", "%d %b %Y %I:%M:%S %p %z")
+    return date.strftime("%a %b %d %H:%M:%S %z %Y")
+
+def _url_entities(text: str, expanded: List[str], tco: List[str]) -> List[dict]:
+    urls = []
+    for expanded_url, url in zip(expanded or [], tco or []):
+        start = text.find(url)
+        if start < 0:
+            continue
+        urls.append({"url": url, "expanded_url": expanded_url, "display_url": expanded_url.split("://", 1)[-1], "indices": [start, start + len(url)]})
+    return urls
+
+def api_user(user: dict) -> dict:
+    '''the API user object a serialized user was made from.'''
+    raw = {
+        "id": user["id"],
+        "id_str": str(user["id"]),
+        "screen_name": user["username"],
+        "name": user["displayname"],
+        "description": user["raw_description"] or "",
+        "entities": {"description": {"urls": [
+            {"display_url": url["text"], "expanded_url": url["url"], "url": url["tcourl"], "indices": list(url["indices"])}
+            for url in user["description_urls"] or []
+        ]}},
+        "created_at": _created_at(user["created"]),
+        "followers_count": user["followers_count"],
+        "friends_count": user["friends_count"],
+        "statuses_count": user["statusesCount"],
+        "favourites_count": user["favourites_count"],
+        "listed_count": user["listed_count"],
+        "media_count": user["media_count"],
+        "location": user["location"],
+        "profile_image_url_https": user["profile_image_url"],
+    }
+    if user["verified"] is not None:
+        raw["verified"] = user["verified"]
+    if user["protected"] is not None:
+        raw["protected"] = user["protected"]
+    if user["link_tcourl"] is not None:
+        raw["url"] = user["link_tcourl"]
+        raw["entities"]["url"] = {"urls": [{"url": user["link_tcourl"], "expanded_url": user["link_url"]}]}
+    if user["profile_banner_url"] is not None:
+        raw["profile_banner_url"] = user["profile_banner_url"]
+    return raw
+
+def api_tweet(tweet: dict) -> dict:
+    '''the API tweet object a serialized tweet was made from.'''
+    raw = {
+        "id": tweet["id"],
+        "id_str": str(tweet["id"]),
+        "full_text": tweet["text"],
+        "user_id_str": str(tweet["username"]["id"]),
+        "created_at": _created_at(tweet["date"]),
+        "reply_count": tweet["reply_count"],
+        "retweet_count": tweet["retweet_count"],
+        "favorite_count": tweet["like_count"],
+        "quote_count": tweet["quote_count"],
+        "conversation_id_str": str(tweet["conversation_id"]),
+        "lang": tweet["lang"],
+        "source": tweet["source"],
+        "entities": {
+            "urls": _url_entities(tweet["text"], tweet["outlinks"], tweet["tcooutlinks"]),
+            "user_mentions": [
+                {"id": user["id"], "id_str": str(user["id"]), "screen_name": user["username"], "name": user["displayname"]}
+                for user in tweet["mentioned_users"] or []
+            ],
+            "hashtags": [{"text": text} for text in tweet["hashtags"] or []],
+            "symbols": [{"text": text} for text in tweet["cashtags"] or []],
+        },
+    }
+    media = []
+    for medium in tweet["media"]:
+        if "full_url" in medium:
+            base, query = medium["full_url"].split("?", 1)
+            media.append({"type": "photo", "media_url_https": f"{base}.{query.split('format=')[1].split('&')[0]}"})
+        else:
+            raw_medium = {
+                "type": "video" if "duration" in medium else "animated_gif",
+                "media_url_https": medium["thumbnail_url"],
+                "video_info": {"variants": medium["variants"]},
+            }
+            if "duration" in medium:
+                raw_medium["video_info"]["duration_millis"] = round(medium["duration"] * 1000)
+                views = medium.get("views")
+                raw_medium["ext"] = {"mediaStats": {"r": {"ok": {"viewCount": str(views)}}}} if views not in (None, -1) else None
+            media.append(raw_medium)
+    if media:
+        raw["extended_entities"] = {"media": media}
+    if tweet["in_reply_to_tweet_id"]:
+        raw["in_reply_to_status_id_str"] = str(tweet["in_reply_to_tweet_id"])
+        raw["in_reply_to_user_id_str"] = str(tweet["in_reply_to_user"]["id"])
+        raw["in_reply_to_screen_name"] = tweet["in_reply_to_user"]["username"]
+    if tweet["quoted_tweet"]:
+        raw["quoted_status_id_str"] = str(tweet["quoted_tweet"]["id"])
+    if tweet["coordinates"]:
+        raw["coordinates"] = {"coordinates": [tweet["coordinates"]["longitude"], tweet["coordinates"]["latitude"]]}
+    if tweet["place"]:
+        place = tweet["place"]
+        raw["place"] = {"full_name": place["full_name"], "name": place["name"], "place_type": place["type"], "country": place["country"], "country_code": place["country_code"], "bounding_box": None}
+    return raw
+
+def api_pages(conversation: List[dict], page_size: int=PAGE_SIZE) -> Iterator[dict]:
+    '''split a serialized conversation into API pages (globalObjects + timeline instructions).'''
+    for start in range(0, len(conversation), page_size):
+        tweets, users, entries = {}, {}, []
+        for tweet in conversation[start:start + page_size]:
+            for t in (tweet, tweet["quoted_tweet"]):
+                if not t:
+                    continue
+                tweets[str(t["id"])] = api_tweet(t)
+                users[str(t["username"]["id"])] = api_user(t["username"])
+            entries.append({"entryId": f"tweet-{tweet['id']}", "content": {"item": {"content": {"tweet": {"id": str(tweet["id"])}}}}})
+        yield {"globalObjects": {"tweets": tweets, "users": users}, "timeline": {"instructions": [{"addEntries": {"entries": entries}}]}}
@@ -1,66 +1,140 @@
-import os, json
+import os, json, threading, contextlib
 from tqdm import tqdm
-from yats.tree import buildTree
+from yats.tree import buildTree, iter_dialogues, dialogue_trie
 from yats import Scraper, BACKEND
+from yats.checkpoint import ConversationWriter, iter_conversations, iter_conversation_lines, decode_conversation_line, latest_copies
+from yats.stream import JSONListWriter
+from yats.storage import SQLiteStore
+from yats.columnar import ColumnarWriter
 
 
-def extract_dialogues(path: str, save_as: str):
-    with open(path) as f:
-        data = json.load(f)
-    
-    print("building conversation trees!")
-    trees = []
-    conversations = []
-    for conversation in tqdm(data.values()):
-        tree = buildTree(conversation)
-        trees.append(tree)
-    
+# the payload keys buildTree and the dialogue walks use, the rest isn't sent to worker processes.
+TREE_KEYS = ("id", "conversation_id", "in_reply_to_tweet_id", "reply_count", "text")
+
+def _conversation_dialogues(job):
+    # (conversation_id, tweets or a raw checkpoint line, trie) -> (items to write, number of dialogues).
+    # runs in the worker processes.
+    conversation_id, conversation, trie = job
+    if isinstance(conversation, bytes):
+        conversation = decode_conversation_line(conversation)[1]
+    tree = buildTree(conversation)
+    if trie:
+        dialogues = dialogue_trie(tree)
+        if not dialogues["dialogues"]:
+            return [], 0
+        return [{"conversation_id": conversation_id, **dialogues}], len(dialogues["dialogues"])
+    # dialogues come out depth first, one walk per tree.
+    dialogues = [dialogue for dialogue in iter_dialogues(tree) if len(dialogue) > 1]
+    return dialogues, len(dialogues)
+
+def _windowed_imap(pool, jobs, window: int, chunksize: int):
+    # pool.imap, but at most `window` jobs are in flight: imap reads its whole input ahead, which would hold
+    # every conversation in memory when the workers fall behind the reader. the window rolls, a new job is
+    # let in for every result taken out, so the workers never wait for a whole window to drain.
+    slots = threading.Semaphore(window)
+    stopped = threading.Event()
+    def feed():
+        # runs in the pool's task handler thread.
+        for job in jobs:
+            slots.acquire()
+            if stopped.is_set():
+                return
+            yield job
+    try:
+        for result in pool.imap(_conversation_dialogues, feed(), chunksize=chunksize):
+            slots.release()
+            yield result
+    finally:
+        # unblock the feeder if the consumer stopped early, so that the pool can shut down.
+        stopped.set()
+        slots.release()
+
+def extract_dialogues(path: str, save_as: str, trie: bool = False, workers: int = 1, chunksize: int = 64):
+    # path is a checkpoint folder written by main() or a legacy *_convo.json file.
+    # conversations are read, turned into trees and written out one at a time,
+    # so memory is bounded by the largest conversation rather than the whole dump.
+    # with trie=True every conversation is written as a dialogue trie (each utterance stored once, see
+    # yats.tree.dialogue_trie) instead of repeating shared context in every dialogue;
+    # yats.tree.iter_extracted_dialogues reads both formats back as flat dialogues.
+    # with workers > 1 the conversations are sent to a process pool in chunks of `chunksize`, two chunks
+    # per worker at a time; results are written in input order so the output doesn't depend on the number of workers.
+    # checkpoint lines are passed on undecoded, so json decoding happens in the workers too.
     print("extracting conversations (root to leaf paths)!")
-    for tree in tqdm(trees):
-        for node in tree.values():
-            if not node.isLeaf: continue
-            conversation = node.tolist()
-            if len(conversation) > 1:
-                conversations.append(conversation)
-    
-    print("extracted", len(conversations), "conversations!")
+
+    def jobs():
+        if workers > 1 and os.path.isdir(path):
+            conversations = iter_conversation_lines(path)
+        else:
+            conversations = iter_conversations(path)
+        # a conversation can be checkpointed more than once, the later copy wins.
+        for conversation_id, conversation in latest_copies(path, conversations):
+            if workers > 1 and not isinstance(conversation, bytes):
+                conversation = [{key: tweet[key] for key in TREE_KEYS} for tweet in conversation]
+            yield conversation_id, conversation, trie
+
+    count = 0
     with open(save_as, "w", encoding="utf-8") as f:
-        f.write(json.dumps(
-            conversations, 
-            ensure_ascii=False,
-            indent=4,
-        ))
+        writer = JSONListWriter(f, indent=None if trie else 4, ensure_ascii=False)
+        if workers > 1:
+            from multiprocessing import Pool
+            pool = Pool(workers)
+            results = _windowed_imap(pool, jobs(), workers * chunksize * 2, chunksize)
+        else:
+            pool = None
+            results = map(_conversation_dialogues, jobs())
+        try:
+            for items, num_dialogues in tqdm(results):
+                for item in items:
+                    writer.write(item)
+                count += num_dialogues
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        writer.close()
+    
+    print("extracted", count, "conversations!")
 
-def main(query, limit: int = 30):
-    import json
+def main(query, limit: int = 30, workers: int = 4, normalized: bool = False, remember: bool = False, sqlite: bool = False, columnar: bool = False):
     from tqdm import tqdm
 
-    scraper = Scraper(BACKEND.snscrape)
-    conversation_ids = [x["conversation_id"] for x in tqdm(
-        scraper(query, do_backup=False, limit=limit), desc="top_level")]
-    conversations = {}
+    # with remember, conversations checkpointed by earlier runs of the query are skipped (see yats.seen)
+    # and the search only returns tweets of conversations that weren't fetched yet. it is off by default:
+    # a rerun then only checkpoints conversations it hadn't stored before.
+    scraper = Scraper(BACKEND.snscrape, seen_index=f"{query}_seen.sqlite3" if remember else None)
+    # several search results can belong to the same conversation.
+    conversation_ids = list(dict.fromkeys(x["conversation_id"] for x in tqdm(
+        scraper(query, do_backup=False, limit=limit), desc="top_level")))
     num_convos = len(conversation_ids)
     i, avg_len, total_len = 0, 0, 0
-    pbar = tqdm(conversation_ids, desc=f"tot=0, avg=0")
+    pbar = tqdm(total=num_convos, desc=f"tot=0, avg=0")
     os.makedirs(query+"_backups", exist_ok=True)
 
-    for conversation_id in pbar:
-        i += 1    
-        conversation = scraper.conversation(conversation_id, do_backup=True, 
-                                            backup_path=f"{query}_backups/{conversation_id}.pkl")
-        conversations[conversation_id] = conversation
-        total_len += len(conversation)
-        avg_len = total_len / i
+    # conversations are fetched by a pool of `workers` threads and checkpointed as they finish.
+    # normalized checkpoints store every user once per conversation (see yats.normalize).
+    # with sqlite the conversations go to an indexed database instead (see yats.storage).
+    # with columnar the tweets are also exported for analytics as they come in (see yats.columnar).
+    # both are closed (and flushed) however the loop ends.
+    with contextlib.ExitStack() as stack:
+        if sqlite:
+            checkpoint = stack.enter_context(SQLiteStore(f"{query}_{limit}_convo.sqlite3"))
+        else:
+            checkpoint = stack.enter_context(ConversationWriter(f"{query}_{limit}_convo", normalized=normalized))
+        export = stack.enter_context(ColumnarWriter(f"{query}_{limit}_columns")) if columnar else None
+        for conversation_id, conversation in scraper.conversations(
+                conversation_ids, max_workers=workers, do_backup=True, 
+                backup_folder=f"{query}_backups", state_folder=f"{query}_state"):
+            i += 1    
+            checkpoint.write(conversation_id, conversation)
+            if export is not None:
+                export.write(conversation_id, conversation)
+            total_len += len(conversation)
+            avg_len = total_len / i
 
-        pbar.set_description(f"tot={total_len}, avg={avg_len:.2f}")
-        print(f"checkpointing at {i}/{num_convos} conversations.")
-        with open(f"{query}_{limit}_convo.json", "w") as f:
-            f.write(json.dumps(
-                conversations,
-                ensure_ascii=False,
-                indent=4,
-            ))
-        # json.dump(conversations, f, indent=4)
+            pbar.update(1)
+            pbar.set_description(f"tot={total_len}, avg={avg_len:.2f}")
+    pbar.close()
+    print(f"checkpointed {i}/{num_convos} conversations.")
 
 if __name__ == "__main__":
     # main("アイスクリームが好きです", 30)
@@ -5,16 +5,26 @@ import json
 import pathlib
 import os, time
 import datetime
-import pickle as pkl
+import threading
 from enum import Enum, auto
 from typing import Union, List
 try:
     from .utils import *
     from .base import ScraperException
+    from .tokens import GuestTokenPool
+    from .backup import BackupStore
+    from .cache import ResponseCache
+    from .raw import RawTweetSerializer
+    from .seen import SeenIndex
     from .snscrape import TwitterSearchScraper, TwitterTweetScraper, Tweet, Gif, User, Photo, Video, Place, Medium, VideoVariant, Coordinates, TwitterTweetScraperMode
 except ImportError: 
     from yats.utils import *
     from yats.base import ScraperException
+    from yats.tokens import GuestTokenPool
+    from yats.backup import BackupStore
+    from yats.cache import ResponseCache
+    from yats.raw import RawTweetSerializer
+    from yats.seen import SeenIndex
     from yats.snscrape import TwitterSearchScraper, TwitterTweetScraper, Tweet, Gif, User, Photo, Video, Place, Medium, VideoVariant, Coordinates, TwitterTweetScraperMode
 except SyntaxError:
     pass
@@ -29,8 +39,14 @@ class BACKEND(Enum):
 
 
 class TweetSerializer:
-    def __init__(self, **kwargs):
-        pass
+    def __init__(self, epoch_dates: bool=False, **kwargs):
+        # dates as unix times in seconds (None if unknown) instead of {"date", "time", "utc_offset"} dicts.
+        self.epoch_dates = epoch_dates
+
+    def _serialize_date(self, date):
+        if self.epoch_dates:
+            return datetime_to_epoch(date)
+        return datetime_to_datedict(date)
 
     def _serialize_user(self, user: Union[User, None], to="json"):
         '''serialize user object to dictionary'''
@@ -48,7 +64,7 @@ class TweetSerializer:
         JSON["displayname"] = user.displayname
         JSON["raw_description"] = user.rawDescription
         JSON["description_urls"] = user.descriptionUrls
-        JSON["created"] = datetime_to_datedict(user.created)
+        JSON["created"] = self._serialize_date(user.created)
         JSON["followers_count"] = user.followersCount
         JSON["friends_count"] = user.friendsCount
         JSON["statusesCount"] = user.statusesCount
@@ -184,7 +200,7 @@ class TweetSerializer:
         try:
             JSON["id"] = tweet.id
             JSON["url"] = tweet.url
-            JSON["date"] = datetime_to_datedict(tweet.date)
+            JSON["date"] = self._serialize_date(tweet.date)
             JSON["text"] = tweet.content
             JSON["username"] = self._serialize_user(tweet.user)
             JSON["reply_count"] = tweet.replyCount
@@ -254,51 +270,238 @@ class TweepyWrapper:
 
 
 class SNScrapeWrapper:
-    def __init__(self, **kwargs):
+    def __init__(self, token_pool: Union[GuestTokenPool, None]=None, response_cache: Union[ResponseCache, None]=None, fast_path: bool=False, seen_index: Union[SeenIndex, str, pathlib.Path, None]=None, **kwargs):
         self.serializer = TweetSerializer(**kwargs)
-        self._results_backup = []
-
-    def __call__(self, query: str, limit: int=100, do_backup: bool=True, backup_folder: Union[str, pathlib.Path]="/tmp/.backup/"):
-        self._results_backup = [] # backup list to save results, in case user fails to store them.
+        # with fast_path the scrapers serialize API json directly (same output), backups then hold serialized tweets.
+        self.raw_serializer = RawTweetSerializer(**kwargs) if fast_path else None
+        # guest tokens shared by all scrapers created by this wrapper (None: the process wide pool).
+        self.token_pool = token_pool
+        # API responses are recorded to/replayed from this cache, if given.
+        self.response_cache = response_cache
+        # tweets and conversations of earlier runs, skipped by re-crawls (see yats.seen).
+        if seen_index is not None and not isinstance(seen_index, SeenIndex):
+            seen_index = SeenIndex(seen_index)
+        self.seen_index = seen_index
+        self._backup_stores = {} # backup folder -> BackupStore
+        self._backup_lock = threading.Lock()
+        # requests conversation() didn't have to make because replies were already covered (a lower bound).
+        self.saved_requests = 0
+        self._stats_lock = threading.Lock()
+
+    def _scraper_kwargs(self, **kwargs):
+        '''keyword arguments shared by all the scrapers created by this wrapper.'''
+        return dict(guestTokenPool=self.token_pool, responseCache=self.response_cache, tweetFactory=self.raw_serializer, **kwargs)
+
+    def _add_saved_requests(self, scraper: TwitterTweetScraper):
+        with self._stats_lock:
+            self.saved_requests += scraper.savedRequests
+
+    def _known(self, tweet) -> bool:
+        if self.seen_index is None:
+            return False
+        if isinstance(tweet, dict):
+            tweet_id, conversation_id = tweet["id"], tweet["conversation_id"]
+        else:
+            tweet_id, conversation_id = tweet.id, tweet.conversationId
+        return self.seen_index.is_finished(conversation_id) or self.seen_index.has_tweet(tweet_id)
+
+    def remember(self, conversation_id: Union[str, int], conversation: List[dict]):
+        '''record a conversation returned by conversation() in the seen index, once it has been stored.
+        later runs then skip it. conversations() and aconversations() do this themselves. None (not fetched) is ignored.'''
+        if self.seen_index is not None and conversation is not None:
+            self.seen_index.finish_conversation(conversation_id, ((tweet["id"], tweet["in_reply_to_tweet_id"], tweet["reply_count"]) for tweet in conversation))
+
+    def _serialize(self, tweet):
+        # the fast path yields already serialized tweets.
+        return tweet if isinstance(tweet, dict) else self.serializer(tweet)
+
+    def backup_store(self, backup_folder: Union[str, pathlib.Path]) -> BackupStore:
+        '''the (shared) backup store kept in `backup_folder`.'''
+        backup_folder = os.path.abspath(backup_folder)
+        with self._backup_lock:
+            if backup_folder not in self._backup_stores:
+                self._backup_stores[backup_folder] = BackupStore(backup_folder)
+            return self._backup_stores[backup_folder]
+
+    def restore(self, conversation_id: Union[str, int, None]=None, backup_folder: Union[str, pathlib.Path]="/tmp/.backup/"):
+        '''serialized tweets from the backup store, only those of `conversation_id` if it is given.'''
+        return self.backup_store(backup_folder).replay(self.serializer, conversation_id)
+
+    def __call__(self, query: str, limit: int=100, do_backup: bool=True, backup_folder: Union[str, pathlib.Path]="/tmp/.backup/", state_path: Union[str, pathlib.Path, None]=None):
+        '''search for `query`. if `state_path` is given the pagination state is saved there and an interrupted search resumes from it
+        (the tweets found before the interruption are returned again); a search that reaches `limit` is complete and leaves no state.
+        with a seen index, tweets of finished conversations and tweets handed out before are skipped (and don't count towards `limit`).'''
+        tweets = [] # raw tweets, for the backup in case user fails to store the results.
         results = []
-        tweet_generator = TwitterSearchScraper(query).get_items()
-        for i, tweet in enumerate(tweet_generator):
-            if i == limit: break
-            self._results_backup.append(tweet)
-            results.append(self.serializer(tweet))
-        # create a backup archive in case the user fails to save the returned results object.
+        scraper = TwitterSearchScraper(query, **self._scraper_kwargs(stateFile=state_path))
+        tweet_generator = scraper.get_items()
+        for tweet in tweet_generator:
+            if len(tweets) == limit:
+                # stopped on purpose: the next search starts afresh instead of resuming from here.
+                tweet_generator.close()
+                scraper.clear_state()
+                break
+            if self._known(tweet): continue
+            tweets.append(tweet)
+            results.append(self._serialize(tweet))
+        # back up the tweets in case the user fails to save the returned results object.
         if do_backup:
-            os.makedirs(backup_folder, exist_ok=True)
-            fname = os.path.join(backup_folder, f"{time.time()}")
-            with open(fname, "wb") as f:
-                pkl.dump(self._results_backup, f)
+            self.backup_store(backup_folder).add(tweets)
 
         return results
 
-    def conversation(self, conversation_id: Union[str, int], do_backup: bool=False, backup_path: Union[str, pathlib.Path]="/tmp/backup.json"):
+    def conversation(self, conversation_id: Union[str, int], do_backup: bool=False, backup_folder: Union[str, pathlib.Path]="/tmp/.backup/", progress: bool=True, state_path: Union[str, pathlib.Path, None]=None):
         from tqdm import tqdm
-        '''get conversation using TwitterTweetScraper with the enum value of TwitterTweetScraperMode.RECURSE'''
+        '''get conversation using TwitterTweetScraper with the enum value of TwitterTweetScraperMode.RECURSE
+        returns None if the conversation wasn't fetched: the fetch failed, or with a seen index it was stored before.
+        an empty list means it was fetched and is empty. call remember() once the returned conversation is stored.'''
         results = []
+        if self.seen_index is not None and self.seen_index.is_finished(conversation_id):
+            return None
+        tweets = []
         try:
-            conv_generator = TwitterTweetScraper(
+            scraper = TwitterTweetScraper(
                 str(conversation_id), 
-                TwitterTweetScraperMode.RECURSE
-            ).get_items()
+                TwitterTweetScraperMode.RECURSE,
+                seenIndex=self.seen_index,
+                **self._scraper_kwargs(stateFile=state_path),
+            )
+            for tweet in tqdm(scraper.get_items(), disable=not(progress)):
+                tweets.append(tweet)
+                results.append(self._serialize(tweet))
         except ScraperException:
-            # catch exceptions and return empty list.
+            # catch exceptions and return None, a partial conversation isn't returned.
             print(f"failed to get {conversation_id}")
-            return []
+            return None
+        self._add_saved_requests(scraper)
+        # back up the tweets in case the user fails to save the returned results object.
+        if do_backup:
+            self.backup_store(backup_folder).add(tweets)
+
+        return results
+
+    def conversations(self, conversation_ids: List[Union[str, int]], max_workers: int=8, do_backup: bool=False, backup_folder: Union[str, pathlib.Path]="/tmp/.backup/", state_folder: Union[str, pathlib.Path, None]=None):
+        '''get many conversations at once, using a pool of at most `max_workers` threads.
+        yields (conversation_id, conversation) pairs in the order in which they finish, once per distinct id.
+        if `state_folder` is given, interrupted conversations resume from their saved state.
+        with a seen index, conversations stored before are skipped, and a conversation is remembered once the
+        caller comes back for the next one (i.e. after it was stored).
+        a conversation whose fetch fails is reported and skipped, the others are still yielded.'''
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+        futures = {}
+        try:
+            # search results often share a conversation, each one is fetched once.
+            for conversation_id in dict.fromkeys(conversation_ids):
+                if self.seen_index is not None and self.seen_index.is_finished(conversation_id): continue
+                future = pool.submit(
+                    self.conversation, conversation_id, do_backup=do_backup, 
+                    backup_folder=backup_folder,
+                    progress=False,
+                    state_path=os.path.join(state_folder, f"{conversation_id}.json") if state_folder else None,
+                )
+                futures[future] = conversation_id
+            for future in as_completed(futures):
+                conversation_id = futures[future]
+                try:
+                    conversation = future.result()
+                except Exception as e:
+                    print(f"failed to get {conversation_id}: {e!r}")
+                    continue
+                if conversation is None:
+                    continue # failed, already reported.
+                yield conversation_id, conversation
+                self.remember(conversation_id, conversation)
+        finally:
+            # on an early exit (error or close) don't start the fetches that are still queued.
+            # (python 3.8's shutdown has no cancel_futures)
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=True)
+
+    async def acall(self, query: str, limit: int=100, do_backup: bool=True, backup_folder: Union[str, pathlib.Path]="/tmp/.backup/", state_path: Union[str, pathlib.Path, None]=None):
+        '''asyncio variant of __call__. the seen index, state file and backup store are used from the default
+        executor, so their disk/sqlite work doesn't block the event loop.'''
+        import asyncio
+        loop = asyncio.get_running_loop()
+        tweets = []
+        results = []
+        scraper = TwitterSearchScraper(query, **self._scraper_kwargs(stateFile=state_path))
+        tweet_generator = scraper.aget_items()
+        try:
+            async for tweet in tweet_generator:
+                if len(results) == limit:
+                    await loop.run_in_executor(None, scraper.clear_state)
+                    break
+                if self.seen_index is not None and await loop.run_in_executor(None, self._known, tweet): continue
+                tweets.append(tweet)
+                results.append(self._serialize(tweet))
+        finally:
+            await tweet_generator.aclose()
+            await scraper.aclose()
+        if do_backup:
+            await loop.run_in_executor(None, self.backup_store(backup_folder).add, tweets)
+
+        return results
 
-        for tweet in tqdm(conv_generator):
-            self._results_backup.append(tweet)
-            results.append(self.serializer(tweet))
-        # create a backup archive in case the user fails to save the returned results object.
+    async def aconversation(self, conversation_id: Union[str, int], do_backup: bool=False, backup_folder: Union[str, pathlib.Path]="/tmp/.backup/", state_path: Union[str, pathlib.Path, None]=None):
+        '''asyncio variant of conversation, None if the conversation wasn't fetched. blocking work runs in the
+        default executor, like in acall.'''
+        import asyncio
+        loop = asyncio.get_running_loop()
+        results = []
+        if self.seen_index is not None and await loop.run_in_executor(None, self.seen_index.is_finished, conversation_id):
+            return None
+        scraper = TwitterTweetScraper(
+            str(conversation_id), 
+            TwitterTweetScraperMode.RECURSE,
+            seenIndex=self.seen_index,
+            **self._scraper_kwargs(stateFile=state_path),
+        )
+        tweets = []
+        try:
+            async for tweet in scraper.aget_items():
+                tweets.append(tweet)
+                results.append(self._serialize(tweet))
+        except ScraperException:
+            # catch exceptions and return None, a partial conversation isn't returned.
+            print(f"failed to get {conversation_id}")
+            return None
+        finally:
+            await scraper.aclose()
+        self._add_saved_requests(scraper)
         if do_backup:
-            with open(backup_path, "wb") as f:
-                pkl.dump(self._results_backup, f)
+            await loop.run_in_executor(None, self.backup_store(backup_folder).add, tweets)
 
         return results
 
+    async def aconversations(self, conversation_ids: List[Union[str, int]], max_concurrency: int=64, do_backup: bool=False, backup_folder: Union[str, pathlib.Path]="/tmp/.backup/", state_folder: Union[str, pathlib.Path, None]=None):
+        '''asyncio variant of conversations: at most `max_concurrency` conversations are paginated at once on the running event loop.
+        yields (conversation_id, conversation) pairs in the order in which they finish, remembered like in conversations();
+        failed conversations are skipped.'''
+        import asyncio
+        semaphore = asyncio.Semaphore(max_concurrency)
+        loop = asyncio.get_running_loop()
+        conversation_ids = list(dict.fromkeys(conversation_ids))
+        if self.seen_index is not None:
+            conversation_ids = await loop.run_in_executor(None, lambda: [conversation_id for conversation_id in conversation_ids if not self.seen_index.is_finished(conversation_id)])
+
+        async def fetch(conversation_id):
+            async with semaphore:
+                conversation = await self.aconversation(
+                    conversation_id, do_backup=do_backup,
+                    backup_folder=backup_folder,
+                    state_path=os.path.join(state_folder, f"{conversation_id}.json") if state_folder else None,
+                )
+            return conversation_id, conversation
+
+        for future in asyncio.as_completed([fetch(conversation_id) for conversation_id in conversation_ids]):
+            conversation_id, conversation = await future
+            if conversation is None:
+                continue # failed, already reported.
+            yield conversation_id, conversation
+            await loop.run_in_executor(None, self.remember, conversation_id, conversation)
+
 
 class Scraper:
     '''
@@ -319,6 +522,24 @@ class Scraper:
     def conversation(self, conversation_id, **kwargs):
         return self.engine.conversation(conversation_id, **kwargs)
 
+    def conversations(self, conversation_ids, **kwargs):
+        return self.engine.conversations(conversation_ids, **kwargs)
+
+    async def acall(self, query, **kwargs):
+        return await self.engine.acall(query, **kwargs)
+
+    async def aconversation(self, conversation_id, **kwargs):
+        return await self.engine.aconversation(conversation_id, **kwargs)
+
+    def aconversations(self, conversation_ids, **kwargs):
+        return self.engine.aconversations(conversation_ids, **kwargs)
+
+    def restore(self, conversation_id=None, **kwargs):
+        return self.engine.restore(conversation_id, **kwargs)
+
+    def remember(self, conversation_id, conversation):
+        return self.engine.remember(conversation_id, conversation)
+
     @property
     def engine(self):
         return self._engine
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# bounded, append-only backup store for scraped tweets.
+import os
+import json
+import gzip
+import zlib
+import time
+import array
+import pathlib
+import threading
+import pickle as pkl
+from typing import Union, List, Iterator, Callable
+
+
+def _tweet_id(tweet) -> int:
+    # tweets are Tweet objects, or already serialized dicts.
+    return int(tweet["id"] if isinstance(tweet, dict) else tweet.id)
+
+def _conversation_id(tweet) -> str:
+    return str(tweet["conversation_id"] if isinstance(tweet, dict) else tweet.conversationId)
+
+
+class BackupStore:
+    '''
+    Backup of scraped tweets in case the caller fails to save the results.
+
+    Tweets are pickled in batches and appended as gzip members to numbered segments in `folder`; every tweet
+    is written only once. A segment is sealed once it grows past `segment_size` bytes, and the oldest segments
+    are deleted when the store grows past `max_size` bytes or they are older than `max_age` seconds.
+    `index.jsonl` maps conversation ids to the segments holding their tweets, so restoring a single
+    conversation only reads those segments. It is a log: every add appends the counts of that batch only,
+    and the log is compacted to one line per segment when the store is opened.
+    '''
+    def __init__(self, folder: Union[str, pathlib.Path], segment_size: int=16*2**20, max_size: int=2**30, max_age: float=7*24*3600):
+        self.folder = folder
+        self.segment_size = segment_size
+        self.max_size = max_size
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        self._index_path = os.path.join(folder, "index.jsonl")
+        self._segments = self._load_index()
+        self._compact_index()
+        # ids of stored tweets, so that only new tweets are written.
+        self._stored = set()
+        for segment in self._segments:
+            self._stored.update(self._segment_ids(segment))
+
+    def _path(self, segment: dict, ext: str) -> str:
+        return os.path.join(self.folder, f"{segment['name']}.{ext}")
+
+    def _segment_ids(self, segment: dict) -> array.array:
+        ids = array.array("q")
+        path = self._path(segment, "ids")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                ids.frombytes(f.read())
+        return ids
+
+    def _load_index(self) -> List[dict]:
+        '''replay the index log: {"name", "created"} starts a segment, {"name", "size", "conversations"} adds a batch
+        (conversation id -> number of tweets), {"name", "dropped"} removes the segment.'''
+        segments = {} # name -> segment, oldest first
+        legacy_path = os.path.join(self.folder, "index.json") # written by earlier versions in one piece.
+        if os.path.exists(legacy_path):
+            with open(legacy_path) as f:
+                segments = {segment["name"]: segment for segment in json.load(f)["segments"]}
+        if os.path.exists(self._index_path):
+            with open(self._index_path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break # truncated by a crash.
+                    record = json.loads(line)
+                    if record.get("dropped"):
+                        segments.pop(record["name"], None)
+                        continue
+                    segment = segments.setdefault(record["name"], {"name": record["name"], "created": record.get("created", time.time()), "size": 0, "conversations": {}})
+                    segment["size"] = record.get("size", segment["size"])
+                    for conversation_id, count in record.get("conversations", {}).items():
+                        segment["conversations"][conversation_id] = segment["conversations"].get(conversation_id, 0) + count
+        return list(segments.values())
+
+    def _compact_index(self):
+        '''rewrite the log with one line per segment.'''
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for segment in self._segments:
+                f.write(json.dumps(segment) + "\n")
+        os.replace(tmp_path, self._index_path)
+        legacy_path = os.path.join(self.folder, "index.json")
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+
+    def _log(self, record: dict):
+        with open(self._index_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def _active_segment(self) -> dict:
+        if not self._segments or self._segments[-1]["size"] >= self.segment_size:
+            name = f"{int(self._segments[-1]['name']) + 1:05d}" if self._segments else "00000"
+            self._segments.append({"name": name, "created": time.time(), "size": 0, "conversations": {}})
+            self._log({"name": name, "created": self._segments[-1]["created"]})
+        return self._segments[-1]
+
+    def _enforce_limits(self):
+        '''drop the oldest segments (never the active one) while the store is too large or too old.'''
+        now = time.time()
+        while len(self._segments) > 1:
+            oldest = self._segments[0]
+            total = sum(segment["size"] for segment in self._segments)
+            if total <= self.max_size and now - oldest["created"] <= self.max_age:
+                break
+            self._stored.difference_update(self._segment_ids(oldest))
+            for ext in ("pkl.gz", "ids"):
+                if os.path.exists(self._path(oldest, ext)):
+                    os.remove(self._path(oldest, ext))
+            del self._segments[0]
+            self._log({"name": oldest["name"], "dropped": True})
+
+    def add(self, tweets: List) -> int:
+        '''back up the tweets that aren't stored yet. returns the number of tweets written.'''
+        with self._lock:
+            new, ids = [], array.array("q")
+            for tweet in tweets:
+                tweet_id = _tweet_id(tweet)
+                if tweet_id in self._stored:
+                    continue
+                self._stored.add(tweet_id)
+                new.append(tweet)
+                ids.append(tweet_id)
+            if not new:
+                return 0
+            segment = self._active_segment()
+            with gzip.open(self._path(segment, "pkl.gz"), "ab") as f:
+                pkl.dump(new, f)
+            with open(self._path(segment, "ids"), "ab") as f:
+                ids.tofile(f)
+            segment["size"] = os.path.getsize(self._path(segment, "pkl.gz"))
+            counts = {}
+            for tweet in new:
+                conversation_id = _conversation_id(tweet)
+                counts[conversation_id] = counts.get(conversation_id, 0) + 1
+            for conversation_id, count in counts.items():
+                segment["conversations"][conversation_id] = segment["conversations"].get(conversation_id, 0) + count
+            self._log({"name": segment["name"], "size": segment["size"], "conversations": counts})
+            self._enforce_limits()
+            return len(new)
+
+    def restore(self, conversation_id: Union[str, int, None]=None) -> Iterator:
+        '''yield the backed up tweets, oldest first; only those of `conversation_id` if it is given.'''
+        with self._lock:
+            segments = [dict(segment) for segment in self._segments]
+        if conversation_id is not None:
+            conversation_id = str(conversation_id)
+            segments = [segment for segment in segments if conversation_id in segment["conversations"]]
+        for segment in segments:
+            path = self._path(segment, "pkl.gz")
+            if not os.path.exists(path):
+                continue # dropped in the meantime.
+            with gzip.open(path, "rb") as f:
+                while True:
+                    try:
+                        batch = pkl.load(f)
+                    except EOFError:
+                        break # end of segment.
+                    except (OSError, zlib.error, pkl.UnpicklingError):
+                        break # a batch cut short by a crash.
+                    for tweet in batch:
+                        if conversation_id is None or _conversation_id(tweet) == conversation_id:
+                            yield tweet
+
+    def replay(self, serializer: Callable, conversation_id: Union[str, int, None]=None) -> List[dict]:
+        '''restore backed up tweets through `serializer` (e.g. a TweetSerializer).'''
+        return [tweet if isinstance(tweet, dict) else serializer(tweet) for tweet in self.restore(conversation_id)]
+
+    def __len__(self):
+        return len(self._stored)
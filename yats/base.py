@@ -2,6 +2,12 @@ import logging
 import requests
 import dataclasses
 import abc, copy, time, json, datetime, functools, warnings
+import asyncio, inspect
+try:
+	import aiohttp
+	import yarl
+except ImportError: # the asyncio transport is optional
+	aiohttp = None
 
 
 logger = logging.getLogger(__name__)
@@ -48,19 +54,102 @@ def _json_dataclass_to_dict(obj):
 		return copy.deepcopy(obj)
 
 
+_SCALAR_TYPES = (str, int, float, bool, type(None))
+_jsonEncoder = json.JSONEncoder(default = _json_serialise_datetime)
+
+
+def _compile_dataclass_encoder(cls):
+	'''Build the function converting instances of the dataclass cls to what _json_dataclass_to_dict returns for them (up to copies: values are shared, not deep-copied).
+
+	The field and property names are looked up once per class instead of on every object.'''
+	typeName = f'{cls.__module__}.{cls.__name__}'
+	fieldNames = tuple(field.name for field in dataclasses.fields(cls))
+	# Non-deprecated properties, in dir order like _json_dataclass_to_dict
+	propertyNames = tuple(k for k in dir(cls) if isinstance(getattr(cls, k, None), property))
+	assert '_type' not in fieldNames and '_type' not in propertyNames
+	names = fieldNames + propertyNames
+
+	def encode(obj):
+		out = {'_type': typeName}
+		for name in names:
+			out[name] = _json_value(getattr(obj, name))
+		return out
+	return encode
+
+
+_dataclassEncoders = {} # class -> compiled encoder
+
+
+def _json_value(obj):
+	'''The JSON-ready form of obj, equivalent to _json_dataclass_to_dict but using compiled per-class encoders.'''
+	objType = type(obj)
+	if objType in _SCALAR_TYPES:
+		return obj
+	if (encoder := _dataclassEncoders.get(objType)) is not None:
+		return encoder(obj)
+	if isinstance(obj, _JSONDataclass) or (dataclasses.is_dataclass(obj) and not isinstance(obj, type)):
+		encoder = _dataclassEncoders[objType] = _compile_dataclass_encoder(objType)
+		return encoder(obj)
+	if isinstance(obj, (tuple, list)):
+		return [_json_value(x) for x in obj]
+	if isinstance(obj, dict):
+		return {k: _json_value(v) for k, v in obj.items()}
+	if isinstance(obj, (datetime.datetime, datetime.date)):
+		return obj.isoformat()
+	return obj # Other objects (IntWithGranularity, ...) are left to the JSON encoder as they are
+
+
+def json_lines(items):
+	'''Encode many items into a single JSONL buffer, one item.json() per line.'''
+	return ''.join(f'{item.json()}\n' for item in items)
+
+
+def _slots_getstate(self):
+	return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _slots_setstate(self, state):
+	if isinstance(state, tuple): # (__dict__, slots) state of an object pickled without __getstate__
+		state = {**(state[0] or {}), **state[1]}
+	for name, value in state.items():
+		object.__setattr__(self, name, value)
+
+
+def _add_slots(cls):
+	'''Recreate the dataclass cls with __slots__ for its fields, like dataclasses.dataclass(slots = True) does on Python 3.10+.
+
+	Instances only lose their __dict__ if every base class defines __slots__ as well.
+	They are pickled as a dict of field values, so pickles load across the dict-based and the slotted class.'''
+	fieldNames = tuple(field.name for field in dataclasses.fields(cls))
+	inherited = {name for base in cls.__mro__[1:] for name in getattr(base, '__slots__', ())}
+	clsDict = dict(cls.__dict__)
+	clsDict['__slots__'] = tuple(name for name in fieldNames if name not in inherited)
+	for name in fieldNames:
+		clsDict.pop(name, None) # Defaults live on in the generated __init__
+	clsDict.pop('__dict__', None)
+	clsDict.pop('__weakref__', None)
+	clsDict['__getstate__'] = _slots_getstate
+	clsDict['__setstate__'] = _slots_setstate
+	newCls = type(cls)(cls.__name__, cls.__bases__, clsDict)
+	newCls.__qualname__ = cls.__qualname__
+	return newCls
+
+
 @dataclasses.dataclass
 class _JSONDataclass:
 	'''A base class for dataclasses for conversion to JSON'''
 
+	__slots__ = ()
+
 	def json(self):
 		'''Convert the object to a JSON string'''
-		out = _json_dataclass_to_dict(self)
+		out = _json_value(self)
 		for key, value in list(out.items()): # Modifying the dict below, so make a copy first
 			if isinstance(value, IntWithGranularity):
 				out[key] = int(value)
 				assert f'{key}.granularity' not in out, f'Granularity collision on {key}.granularity'
 				out[f'{key}.granularity'] = value.granularity
-		return json.dumps(out, default = _json_serialise_datetime)
+		return _jsonEncoder.encode(out)
 
 
 @dataclasses.dataclass
@@ -69,6 +158,8 @@ class Item(_JSONDataclass):
 
 	An item can really be anything. The string representation should be useful for the CLI output (e.g. a direct URL for the item).'''
 
+	__slots__ = ()
+
 	@abc.abstractmethod
 	def __str__(self):
 		pass
@@ -80,6 +171,8 @@ class Entity(_JSONDataclass):
 
 	An entity is typically the account of a person or organisation. The string representation should be the preferred direct URL to the entity's page on the network.'''
 
+	__slots__ = ()
+
 	@abc.abstractmethod
 	def __str__(self):
 		pass
@@ -117,6 +210,28 @@ class ScraperException(Exception):
 	pass
 
 
+class _AsyncResponse:
+	'''The parts of requests.Response used by the scrapers, for a response retrieved through the asyncio transport.
+
+	The body is read eagerly, so responseOkCallbacks and callers can use it after the aiohttp response has been released.'''
+
+	def __init__(self, response, content):
+		self.status_code = response.status
+		self.headers = response.headers
+		self.url = str(response.url)
+		self.history = response.history
+		self.cookies = {name: morsel.value for name, morsel in response.cookies.items()}
+		self.content = content
+		self.encoding = response.charset or 'utf-8'
+
+	@property
+	def text(self):
+		return self.content.decode(self.encoding, errors = 'replace')
+
+	def json(self):
+		return json.loads(self.content)
+
+
 class Scraper:
 	'''An abstract base class for a scraper.'''
 
@@ -125,6 +240,7 @@ class Scraper:
 	def __init__(self, retries = 3):
 		self._retries = retries
 		self._session = requests.Session()
+		self._asyncSession = None # created lazily inside the running event loop, see _arequest
 
 	@abc.abstractmethod
 	def get_items(self):
@@ -143,6 +259,7 @@ class Scraper:
 
 	def _request(self, method, url, params = None, data = None, headers = None, timeout = 10, responseOkCallback = None, allowRedirects = True):
 		for attempt in range(self._retries + 1):
+			r = None
 			# The request is newly prepared on each retry because of potential cookie updates.
 			req = self._session.prepare_request(requests.Request(method, url, params = params, data = data, headers = headers))
 			logger.info(f'Retrieving {req.url}')
@@ -183,7 +300,7 @@ class Scraper:
 						level = logging.ERROR
 					logger.log(level, f'Error retrieving {req.url}{msg}{retrying}')
 			if attempt < self._retries:
-				sleepTime = 1.0 * 2**attempt # exponential backoff: sleep 1 second after first attempt, 2 after second, 4 after third, etc.
+				sleepTime = self._retry_delay(attempt, r)
 				logger.info(f'Waiting {sleepTime:.0f} seconds')
 				time.sleep(sleepTime)
 		else:
@@ -192,12 +309,84 @@ class Scraper:
 			raise ScraperException(msg)
 		raise RuntimeError('Reached unreachable code')
 
+	def _retry_delay(self, attempt, r):
+		'''Seconds to wait before retrying after a failed attempt; r is the rejected response or None if the request itself failed.'''
+		return 1.0 * 2**attempt # exponential backoff: sleep 1 second after first attempt, 2 after second, 4 after third, etc.
+
 	def _get(self, *args, **kwargs):
 		return self._request('GET', *args, **kwargs)
 
 	def _post(self, *args, **kwargs):
 		return self._request('POST', *args, **kwargs)
 
+	async def _arequest(self, method, url, params = None, data = None, headers = None, timeout = 10, responseOkCallback = None, allowRedirects = True):
+		'''asyncio counterpart of _request; responseOkCallback may be a plain function or a coroutine function.'''
+		if aiohttp is None:
+			raise ScraperException('The asyncio transport requires aiohttp to be installed')
+		if self._asyncSession is None:
+			self._asyncSession = aiohttp.ClientSession()
+		# Let requests build the URL so that both transports send exactly the same query string.
+		reqUrl = requests.Request(method, url, params = params).prepare().url
+		for attempt in range(self._retries + 1):
+			r = None
+			logger.info(f'Retrieving {reqUrl}')
+			logger.debug(f'... with headers: {headers!r}')
+			if data:
+				logger.debug(f'... with data: {data!r}')
+			try:
+				async with self._asyncSession.request(method, yarl.URL(reqUrl, encoded = True), data = data, headers = headers, allow_redirects = allowRedirects, timeout = aiohttp.ClientTimeout(total = timeout)) as response:
+					r = _AsyncResponse(response, await response.read())
+			except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+				if attempt < self._retries:
+					retrying = ', retrying'
+					level = logging.INFO
+				else:
+					retrying = ''
+					level = logging.ERROR
+				logger.log(level, f'Error retrieving {reqUrl}: {exc!r}{retrying}')
+			else:
+				redirected = f' (redirected to {r.url})' if r.history else ''
+				logger.info(f'Retrieved {reqUrl}{redirected}: {r.status_code}')
+				if responseOkCallback is not None:
+					result = responseOkCallback(r)
+					success, msg = (await result) if inspect.isawaitable(result) else result
+				else:
+					success, msg = (True, None)
+				msg = f': {msg}' if msg else ''
+
+				if success:
+					logger.debug(f'{reqUrl} retrieved successfully{msg}')
+					return r
+				else:
+					if attempt < self._retries:
+						retrying = ', retrying'
+						level = logging.INFO
+					else:
+						retrying = ''
+						level = logging.ERROR
+					logger.log(level, f'Error retrieving {reqUrl}{msg}{retrying}')
+			if attempt < self._retries:
+				sleepTime = self._retry_delay(attempt, r)
+				logger.info(f'Waiting {sleepTime:.0f} seconds')
+				await asyncio.sleep(sleepTime)
+		else:
+			msg = f'{self._retries + 1} requests to {reqUrl} failed, giving up.'
+			logger.fatal(msg)
+			raise ScraperException(msg)
+		raise RuntimeError('Reached unreachable code')
+
+	async def _aget(self, *args, **kwargs):
+		return await self._arequest('GET', *args, **kwargs)
+
+	async def _apost(self, *args, **kwargs):
+		return await self._arequest('POST', *args, **kwargs)
+
+	async def aclose(self):
+		'''Close the asyncio transport's connection pool, if it was ever opened.'''
+		if self._asyncSession is not None:
+			await self._asyncSession.close()
+			self._asyncSession = None
+
 	@classmethod
 	def setup_parser(cls, subparser):
 		pass
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# record/replay cache of twitter API responses.
+import os
+import json
+import gzip
+import time
+import hashlib
+import pathlib
+import threading
+import urllib.parse
+from typing import Union, Optional
+try:
+    from .base import ScraperException
+except ImportError:
+    from yats.base import ScraperException
+
+MODES = ("readwrite", "record", "replay")
+
+
+class ResponseCache:
+    '''
+    Disk cache of decoded API responses, keyed by the endpoint and the normalised request parameters
+    (which include the pagination cursor).
+
+    modes:
+        readwrite: serve hits younger than `ttl` seconds (None: no expiry), fetch and store misses.
+        record: always fetch, store every response.
+        replay: never touch the network, a miss raises ScraperException. recordings never expire in this mode.
+    Once the cache grows past `max_size` bytes the least recently used responses are evicted.
+    '''
+    def __init__(self, folder: Union[str, pathlib.Path], mode: str="readwrite", ttl: Optional[float]=None, max_size: int=2**30):
+        if mode not in MODES:
+            raise ValueError(f"mode should be one of {MODES}, got {mode!r}")
+        self.folder = folder
+        self.mode = mode
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        # path -> (size, last use), the last use is kept as the file's mtime across runs.
+        self._entries = {}
+        for root, _, files in os.walk(folder):
+            for name in files:
+                if name.endswith(".json.gz"):
+                    stat = os.stat(os.path.join(root, name))
+                    self._entries[os.path.join(root, name)] = (stat.st_size, stat.st_mtime)
+        self._size = sum(size for size, _ in self._entries.values())
+
+    @staticmethod
+    def key(endpoint: str, params) -> str:
+        '''cache key of a request. params can be a dict or an urlencoded string; the order of parameters doesn't matter.'''
+        if params is None:
+            items = []
+        elif isinstance(params, str):
+            items = urllib.parse.parse_qsl(params, keep_blank_values=True)
+        else:
+            # like requests, parameters set to None aren't sent.
+            items = [(str(k), str(v)) for k, v in params.items() if v is not None]
+        normalized = json.dumps([endpoint, sorted(items)], ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, key[:2], f"{key}.json.gz")
+
+    def get(self, endpoint: str, params) -> Optional[dict]:
+        '''the cached response, or None if it has to be fetched.'''
+        if self.mode == "record":
+            return None
+        path = self._path(self.key(endpoint, params))
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError, EOFError):
+            record = None
+        if record is not None and self.mode != "replay" and self.ttl is not None and time.time() - record["time"] > self.ttl:
+            record = None
+        if record is None:
+            if self.mode == "replay":
+                raise ScraperException(f"no recorded response for {endpoint} with {params!r}")
+            return None
+        now = time.time()
+        with self._lock:
+            if path in self._entries:
+                self._entries[path] = (self._entries[path][0], now)
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        return record["response"]
+
+    def put(self, endpoint: str, params, response: dict):
+        if self.mode == "replay":
+            return
+        path = self._path(self.key(endpoint, params))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump({"endpoint": endpoint, "params": params, "time": time.time(), "response": response}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            if path in self._entries:
+                self._size -= self._entries[path][0]
+            self._entries[path] = (size, time.time())
+            self._size += size
+            self._evict()
+
+    def _evict(self):
+        '''drop least recently used responses until the cache fits max_size. called with _lock held.'''
+        if self._size <= self.max_size:
+            return
+        for path, (size, _) in sorted(self._entries.items(), key=lambda item: item[1][1]):
+            if self._size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            del self._entries[path]
+            self._size -= size
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# append-only jsonl checkpoints of scraped conversations.
+import os
+import re
+import json
+import glob
+import pickle
+import pathlib
+from typing import Union, List, Dict, Tuple, Iterable, Iterator, Callable
+try:
+    from .stream import iter_json_object
+    from .normalize import normalize, denormalize
+except ImportError:
+    from yats.stream import iter_json_object
+    from yats.normalize import normalize, denormalize
+
+SEGMENT_SUFFIX = ".jsonl"
+PARTIAL_SUFFIX = ".jsonl.part"
+# ConversationWriter starts every line with the conversation id.
+_LINE_ID = re.compile(rb'\{"conversation_id": ("(?:[^"\\]|\\.)*")')
+
+
+def _segment_paths(folder: Union[str, pathlib.Path]) -> List[str]:
+    '''finished and partial segments of a checkpoint folder, oldest first.'''
+    paths = glob.glob(os.path.join(folder, "*" + SEGMENT_SUFFIX)) + glob.glob(os.path.join(folder, "*" + PARTIAL_SUFFIX))
+    return sorted(paths, key=lambda path: int(os.path.basename(path).split(".")[0]))
+
+
+class ConversationWriter:
+    '''
+    Appends one json line per conversation to numbered segments inside `folder`.
+    The active segment is written as `<n>.jsonl.part` and renamed to `<n>.jsonl` once it is larger than
+    `segment_size` bytes (or the writer is closed), so finished segments are never modified again.
+    Data is fsynced every `fsync_every` conversations, so a crash loses at most that many conversations
+    and at worst leaves a truncated last line, which readers skip.
+    With `normalized`, conversations are stored in the normalized form of yats.normalize (every user once per
+    conversation); iter_conversations expands them again.
+    '''
+    def __init__(self, folder: Union[str, pathlib.Path], fsync_every: int=16, segment_size: int=64*2**20, normalized: bool=False):
+        self.folder = folder
+        self.fsync_every = fsync_every
+        self.segment_size = segment_size
+        self.normalized = normalized
+        os.makedirs(folder, exist_ok=True)
+        # segments left behind by a crashed writer are sealed as they are.
+        segments = _segment_paths(folder)
+        for path in segments:
+            if path.endswith(PARTIAL_SUFFIX):
+                os.replace(path, path[:-len(".part")])
+        self._index = int(os.path.basename(segments[-1]).split(".")[0]) + 1 if segments else 0
+        self._file = None
+        self._unsynced = 0
+
+    def _open_segment(self):
+        self._path = os.path.join(self.folder, f"{self._index:05d}{PARTIAL_SUFFIX}")
+        self._file = open(self._path, "w", encoding="utf-8")
+
+    def _seal_segment(self):
+        self.sync()
+        self._file.close()
+        self._file = None
+        os.replace(self._path, self._path[:-len(".part")])
+        self._index += 1
+
+    def write(self, conversation_id: Union[str, int], conversation: List[dict]):
+        '''append a conversation (list of serialized tweets).'''
+        if self._file is None:
+            self._open_segment()
+        if self.normalized:
+            record = {"conversation_id": str(conversation_id), **normalize(conversation)}
+        else:
+            record = {"conversation_id": str(conversation_id), "tweets": conversation}
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every:
+            self.sync()
+        if self._file.tell() >= self.segment_size:
+            self._seal_segment()
+
+    def sync(self):
+        '''flush buffered conversations to disk.'''
+        if self._file is None or self._unsynced == 0:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self):
+        if self._file is not None:
+            self._seal_segment()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _record_to_conversation(record: dict) -> Tuple[str, List[dict]]:
+    if "users" in record:
+        return record["conversation_id"], denormalize(record)
+    return record["conversation_id"], record["tweets"]
+
+
+def iter_located_conversations(path: Union[str, pathlib.Path]) -> Iterator[Tuple[str, List[dict], Union[Tuple[str, int], None]]]:
+    '''like iter_conversations, but also yields where each conversation is stored: (segment path, byte offset)
+    for checkpoint folders, None for legacy files. see load_conversation_at.'''
+    if not os.path.isdir(path):
+        with open(path, encoding="utf-8") as f:
+            for conversation_id, conversation in iter_json_object(f):
+                yield conversation_id, conversation, None
+        return
+    for segment in _segment_paths(path):
+        with open(segment, "rb") as f:
+            offset = 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break # truncated by a crash.
+                yield (*_record_to_conversation(json.loads(line)), (segment, offset))
+                offset += len(line)
+
+
+def load_conversation_at(location: Tuple[str, int]) -> Tuple[str, List[dict]]:
+    '''re-read a single conversation of a checkpoint folder, given its location from iter_located_conversations.'''
+    segment, offset = location
+    if not os.path.exists(segment) and os.path.exists(segment[:-len(".part")]):
+        segment = segment[:-len(".part")] # sealed in the meantime.
+    with open(segment, "rb") as f:
+        f.seek(offset)
+        return _record_to_conversation(json.loads(f.readline()))
+
+
+def iter_conversation_lines(folder: Union[str, pathlib.Path]) -> Iterator[Tuple[str, bytes]]:
+    '''yield (conversation_id, raw json line) pairs of a checkpoint folder without decoding the conversations,
+    e.g. to hand them to other processes. decode the lines with decode_conversation_line.'''
+    for segment in _segment_paths(folder):
+        with open(segment, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break # truncated by a crash.
+                match = _LINE_ID.match(line)
+                conversation_id = json.loads(match.group(1)) if match else json.loads(line)["conversation_id"]
+                yield conversation_id, line
+
+
+def decode_conversation_line(line: bytes) -> Tuple[str, List[dict]]:
+    return _record_to_conversation(json.loads(line))
+
+
+def iter_conversations(path: Union[str, pathlib.Path]) -> Iterator[Tuple[str, List[dict]]]:
+    '''yield (conversation_id, tweets) pairs from a checkpoint folder or a legacy `*_convo.json` file.
+    both are read incrementally, one conversation at a time.'''
+    for conversation_id, conversation, _ in iter_located_conversations(path):
+        yield conversation_id, conversation
+
+
+def load_conversations(path: Union[str, pathlib.Path]) -> Dict[str, List[dict]]:
+    '''rebuild the conversation_id -> tweets dict, the later checkpoint of a conversation wins.'''
+    return dict(iter_conversations(path))
+
+
+def latest_copies(path: Union[str, pathlib.Path], items: Iterable[tuple]) -> Iterator[tuple]:
+    '''filter `items`, pairs or triples of `path` keyed by conversation id (from iter_conversations,
+    iter_located_conversations or iter_conversation_lines), down to the last copy of every conversation:
+    the later checkpoint wins, like in load_conversations. checkpoint folders are scanned for the ids first,
+    without decoding the conversations; legacy files hold every conversation once and are passed through.'''
+    if not os.path.isdir(path):
+        yield from items
+        return
+    last = {} # conversation id -> position of its last copy
+    for position, (conversation_id, _) in enumerate(iter_conversation_lines(path)):
+        last[conversation_id] = position
+    for position, item in enumerate(items):
+        if last.get(item[0], position) == position:
+            yield item
+
+
+class StateFile:
+    '''
+    A small json document holding the state of an interrupted crawl (e.g. pagination cursors).
+    It is replaced atomically, and `tick` only rewrites it every `every` calls.
+    Items the crawl handed out can be appended to a pickle file next to it (`items_path`), so that a resumed crawl
+    can hand them out again; the state records how many of them it covers.
+    '''
+    def __init__(self, path: Union[str, pathlib.Path], every: int=10):
+        self.path = path
+        self.every = every
+        self._ticks = 0
+
+    def load(self) -> Union[dict, None]:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, state: dict):
+        folder = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(folder, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def tick(self, get_state: Callable[[], dict]):
+        '''count a page, saving `get_state()` every `every` pages.'''
+        self._ticks += 1
+        if self._ticks % self.every == 0:
+            self.save(get_state())
+
+    @property
+    def items_path(self) -> str:
+        return f"{self.path}.items"
+
+    def append_items(self, items: list):
+        '''append handed out items, before saving the state that counts them.'''
+        if not items:
+            return
+        folder = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(folder, exist_ok=True)
+        with open(self.items_path, "ab") as f:
+            pickle.dump(items, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def load_items(self, count: int) -> list:
+        '''the first `count` appended items. items appended for a state that was never saved are dropped.'''
+        items = []
+        if os.path.exists(self.items_path):
+            with open(self.items_path, "rb") as f:
+                while len(items) < count:
+                    try:
+                        items.extend(pickle.load(f))
+                    except (EOFError, pickle.UnpicklingError):
+                        break # a batch cut short by a crash
+            items = items[:count]
+        # rewrite the file so that later appends line up with the state again.
+        tmp_path = f"{self.items_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(items, f)
+        os.replace(tmp_path, self.items_path)
+        return items
+
+    def remove(self):
+        '''the crawl is complete, nothing to resume.'''
+        for path in (self.path, self.items_path):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# columnar (parquet/npz) export of serialized tweets for analytics.
+import os
+import glob
+import pathlib
+import collections
+from typing import Union, List, Dict, Optional, Iterable
+try:
+    from .utils import datedict_to_epoch
+    from .checkpoint import iter_conversations, latest_copies
+except ImportError:
+    from yats.utils import datedict_to_epoch
+    from yats.checkpoint import iter_conversations, latest_copies
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError: # pyarrow is optional
+    pa = pq = None
+try:
+    import numpy as np
+except ImportError: # numpy is optional
+    np = None
+
+FORMATS = ("parquet", "npz")
+# table -> [(column, type)]; types are int64, float64, bool, string and timestamp (unix time in seconds).
+SCHEMAS = {
+    "tweets": [
+        ("id", "int64"), ("url", "string"), ("date", "timestamp"), ("text", "string"),
+        ("user_id", "int64"), ("username", "string"),
+        ("reply_count", "int64"), ("retweet_count", "int64"), ("like_count", "int64"), ("quote_count", "int64"),
+        ("conversation_id", "int64"), ("in_reply_to_tweet_id", "int64"), ("in_reply_to_user_id", "int64"),
+        ("retweeted_tweet_id", "int64"), ("quoted_tweet_id", "int64"),
+        ("lang", "string"), ("source", "string"), ("source_url", "string"), ("source_label", "string"),
+        ("longitude", "float64"), ("latitude", "float64"),
+        ("place_full_name", "string"), ("place_name", "string"), ("place_type", "string"),
+        ("place_country", "string"), ("place_country_code", "string"),
+        ("embedded", "bool"), # only seen as a retweeted/quoted tweet.
+    ],
+    "users": [
+        ("id", "int64"), ("username", "string"), ("displayname", "string"),
+        ("description", "string"), ("raw_description", "string"),
+        ("verified", "bool"), ("protected", "bool"), ("created", "timestamp"),
+        ("followers_count", "int64"), ("friends_count", "int64"), ("statuses_count", "int64"),
+        ("favourites_count", "int64"), ("listed_count", "int64"), ("media_count", "int64"),
+        ("location", "string"), ("link_url", "string"), ("link_tcourl", "string"),
+        ("profile_image_url", "string"), ("profile_banner_url", "string"),
+        ("label_description", "string"), ("label_url", "string"), ("label_badge_url", "string"), ("label_long_description", "string"),
+        ("partial", "bool"), # only seen as a mention/reply target: just the id, username and display name.
+    ],
+    "user_description_urls": [("user_id", "int64"), ("text", "string"), ("url", "string"), ("tcourl", "string")],
+    "media": [
+        ("tweet_id", "int64"), ("position", "int64"), ("type", "string"),
+        ("preview_url", "string"), ("full_url", "string"), ("thumbnail_url", "string"),
+        ("duration", "float64"), ("views", "int64"),
+    ],
+    "video_variants": [("tweet_id", "int64"), ("media_position", "int64"), ("url", "string"), ("bitrate", "int64"), ("content_type", "string")],
+    "mentions": [("tweet_id", "int64"), ("position", "int64"), ("user_id", "int64"), ("username", "string")],
+    "hashtags": [("tweet_id", "int64"), ("hashtag", "string")],
+    "cashtags": [("tweet_id", "int64"), ("cashtag", "string")],
+    "outlinks": [("tweet_id", "int64"), ("url", "string")],
+    "tcooutlinks": [("tweet_id", "int64"), ("url", "string")],
+}
+
+
+def _get(obj, key: str):
+    # nested values are dicts once serialized, but TweetSerializer passes a few snscrape objects through (e.g. the user label).
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(key)
+    return getattr(obj, key, None)
+
+def _timestamp(date) -> Optional[int]:
+    # dates are datedicts, or unix times with epoch_dates.
+    if date is None or isinstance(date, (int, float)):
+        return date
+    return datedict_to_epoch(date)
+
+
+class _ParquetSink:
+    '''one parquet file per table and writer, every batch is a row group.'''
+    _TYPES = {"int64": "int64", "float64": "float64", "bool": "bool_", "string": "string"}
+
+    def __init__(self, folder: Union[str, pathlib.Path]):
+        self.folder = folder
+        self._writers = {} # table -> (ParquetWriter, schema)
+
+    def _type(self, kind: str):
+        if kind == "timestamp":
+            return pa.timestamp("s", tz="UTC")
+        return getattr(pa, self._TYPES[kind])()
+
+    def write(self, table: str, columns: Dict[str, list]):
+        if table not in self._writers:
+            schema = pa.schema([(name, self._type(kind)) for name, kind in SCHEMAS[table]])
+            self._writers[table] = (pq.ParquetWriter(_part_path(self.folder, table, "parquet"), schema), schema)
+        writer, schema = self._writers[table]
+        batch = pa.table(columns, schema=schema)
+        writer.write_table(batch, row_group_size=max(1, batch.num_rows))
+
+    def close(self):
+        for writer, _ in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+
+class _NumpySink:
+    '''
+    every batch of a table is a compressed npz file holding one array per column:
+        int64/float64/bool/timestamp columns: `<column>`, nulls stored as 0 with a `<column>.valid` mask.
+        string columns: utf-8 bytes back to back in `<column>.data`, string i is data[offsets[i]:offsets[i+1]] (`<column>.offsets`).
+    npz members are decompressed on access, so readers only pay for the columns they load (see read_table).
+    '''
+    _TYPES = {"int64": "int64", "float64": "float64", "bool": "bool", "timestamp": "int64"}
+
+    def __init__(self, folder: Union[str, pathlib.Path]):
+        self.folder = folder
+
+    def write(self, table: str, columns: Dict[str, list]):
+        arrays = {}
+        for name, kind in SCHEMAS[table]:
+            values = columns[name]
+            valid = np.fromiter((value is not None for value in values), dtype=bool, count=len(values))
+            if kind == "string":
+                encoded = [value.encode("utf-8") if value is not None else b"" for value in values]
+                offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+                offsets[1:] = np.cumsum(np.fromiter((len(data) for data in encoded), dtype=np.int64, count=len(encoded)))
+                arrays[f"{name}.data"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+                arrays[f"{name}.offsets"] = offsets
+            else:
+                arrays[name] = np.array([value if value is not None else 0 for value in values], dtype=self._TYPES[kind])
+            if not valid.all():
+                arrays[f"{name}.valid"] = valid
+        np.savez_compressed(_part_path(self.folder, table, "npz"), **arrays)
+
+    def close(self):
+        pass
+
+
+def _part_path(folder: Union[str, pathlib.Path], table: str, ext: str) -> str:
+    '''next free part file of a table, so that exports can be resumed/appended to.'''
+    os.makedirs(os.path.join(folder, table), exist_ok=True)
+    return os.path.join(folder, table, f"part-{len(glob.glob(os.path.join(folder, table, 'part-*'))):05d}.{ext}")
+
+
+class ColumnarWriter:
+    '''
+    Exports serialized tweets (see TweetSerializer) as typed columns, one folder per table (see SCHEMAS):
+        tweets: scalar fields, the author/reply target/embedded tweets as ids, coordinates and place flattened.
+        users: every user, partial users (mentions, reply targets) flagged as partial.
+        child tables keyed by tweet_id (user_id): media, video_variants, mentions, hashtags, cashtags, outlinks,
+            tcooutlinks, user_description_urls.
+        retweeted/quoted tweets go to the same tables, flagged as embedded unless they are added themselves.
+    Rows are buffered and written every `batch_size` tweets as one row group (parquet) or part file (npz) per
+    table, so an export can be written while scraping. format: "parquet" (needs pyarrow), "npz" (needs numpy),
+    None picks parquet if pyarrow is installed and npz otherwise.
+    Within a batch every tweet and user is one row, in its fullest form. The ids written by earlier batches are
+    remembered (the last `cache_size` per table), so they are only written again when their full form turns up
+    after an embedded/partial one, or after they were forgotten. read_table drops these older rows; the child rows
+    of a forgotten tweet/user are repeated, a `cache_size` above the number of distinct ids avoids that.
+    `write(conversation_id, conversation)` makes it usable like checkpoint.ConversationWriter.
+    '''
+    def __init__(self, folder: Union[str, pathlib.Path], batch_size: int=10000, format: Optional[str]=None, cache_size: int=2**18):
+        if format is None:
+            format = "parquet" if pa is not None else "npz"
+        if format not in FORMATS:
+            raise ValueError(f"format should be one of {FORMATS}, got {format!r}")
+        if format == "parquet" and pa is None:
+            raise ImportError("parquet export needs pyarrow")
+        if format == "npz" and np is None:
+            raise ImportError("columnar export needs pyarrow (parquet) or numpy (npz)")
+        self.folder = folder
+        self.batch_size = batch_size
+        self.format = format
+        os.makedirs(folder, exist_ok=True)
+        self._sink = _ParquetSink(folder) if format == "parquet" else _NumpySink(folder)
+        self.cache_size = cache_size
+        # id -> written in the embedded/partial form, for the ids written by earlier batches (least recent first).
+        self._written = {"tweets": collections.OrderedDict(), "users": collections.OrderedDict()}
+        # id -> (tweet or user, embedded/partial) of the current batch.
+        self._pending = {"tweets": {}, "users": {}}
+        self._buffered = 0
+        self._reset()
+
+    def _reset(self):
+        self._columns = {table: {name: [] for name, _ in schema} for table, schema in SCHEMAS.items()}
+
+    def _append(self, table: str, *row):
+        for (name, _), value in zip(SCHEMAS[table], row):
+            self._columns[table][name].append(value)
+
+    def _queue(self, table: str, key: int, obj: dict, weak: bool):
+        '''buffer a tweet/user unless it is written or buffered in a form at least as full already.'''
+        written = self._written[table].get(key)
+        if written is not None and (weak or not written):
+            self._written[table].move_to_end(key)
+            return
+        pending = self._pending[table].get(key)
+        if pending is None or (pending[1] and not weak):
+            self._pending[table][key] = (obj, weak)
+
+    def _add_user(self, user) -> Optional[int]:
+        if user is None:
+            return None
+        self._queue("users", user["id"], user, user["followers_count"] is None)
+        return user["id"]
+
+    def _add_tweet(self, tweet: Optional[dict], embedded: bool) -> Optional[int]:
+        if tweet is None:
+            return None
+        for user in (tweet.get("username"), tweet.get("in_reply_to_user"), *(tweet.get("mentioned_users") or ())):
+            self._add_user(user)
+        self._add_tweet(tweet.get("retweeted_tweet"), True)
+        self._add_tweet(tweet.get("quoted_tweet"), True)
+        self._queue("tweets", tweet["id"], tweet, embedded)
+        return tweet["id"]
+
+    def _remember(self, table: str, key: int, weak: bool):
+        written = self._written[table]
+        written[key] = weak
+        written.move_to_end(key)
+        if len(written) > self.cache_size:
+            written.popitem(last=False)
+
+    def _write_user(self, user: dict, partial: bool):
+        user_id = user["id"]
+        self._remember("users", user_id, partial)
+        label = user.get("label")
+        self._append(
+            "users", user_id, user["username"], user.get("displayname"),
+            user.get("description"), user.get("raw_description"),
+            user.get("verified"), user.get("protected"), _timestamp(user.get("created")),
+            user.get("followers_count"), user.get("friends_count"), user.get("statusesCount"),
+            user.get("favourites_count"), user.get("listed_count"), user.get("media_count"),
+            user.get("location"), user.get("link_url"), user.get("link_tcourl"),
+            user.get("profile_image_url"), user.get("profile_banner_url"),
+            _get(label, "description"), _get(label, "url"), _get(label, "badgeUrl"), _get(label, "longDescription"),
+            partial,
+        )
+        # partial users have no description urls.
+        for url in user.get("description_urls") or ():
+            self._append("user_description_urls", user_id, _get(url, "text"), _get(url, "url"), _get(url, "tcourl"))
+
+    def _write_tweet(self, tweet: dict, embedded: bool):
+        tweet_id = tweet["id"]
+        # an embedded tweet carries the same media, mentions, etc. as its full form: those rows are written once.
+        children = tweet_id not in self._written["tweets"]
+        self._remember("tweets", tweet_id, embedded)
+        user, coordinates, place = tweet.get("username"), tweet.get("coordinates"), tweet.get("place")
+        self._append(
+            "tweets", tweet_id, tweet.get("url"), _timestamp(tweet.get("date")), tweet.get("text"),
+            _get(user, "id"), _get(user, "username"),
+            tweet.get("reply_count"), tweet.get("retweet_count"), tweet.get("like_count"), tweet.get("quote_count"),
+            tweet.get("conversation_id"), tweet.get("in_reply_to_tweet_id"), _get(tweet.get("in_reply_to_user"), "id"),
+            _get(tweet.get("retweeted_tweet"), "id"), _get(tweet.get("quoted_tweet"), "id"),
+            tweet.get("lang"), tweet.get("source"), tweet.get("source_url"), tweet.get("source_label"),
+            _get(coordinates, "longitude"), _get(coordinates, "latitude"),
+            _get(place, "full_name"), _get(place, "name"), _get(place, "type"), _get(place, "country"), _get(place, "country_code"),
+            embedded,
+        )
+        if not children:
+            return
+        for position, medium in enumerate(tweet.get("media") or ()):
+            kind = "photo" if "full_url" in medium else "video" if "duration" in medium else "gif"
+            self._append(
+                "media", tweet_id, position, kind, medium.get("preview_url"), medium.get("full_url"),
+                medium.get("thumbnail_url"), medium.get("duration"), medium.get("views"),
+            )
+            for variant in medium.get("variants") or ():
+                self._append("video_variants", tweet_id, position, variant["url"], variant.get("bitrate"), variant.get("content_type"))
+        for position, user in enumerate(tweet.get("mentioned_users") or ()):
+            self._append("mentions", tweet_id, position, user["id"], user["username"])
+        for table, key in (("hashtags", "hashtags"), ("cashtags", "cashtags"), ("outlinks", "outlinks"), ("tcooutlinks", "tcooutlinks")):
+            for value in tweet.get(key) or ():
+                self._append(table, tweet_id, value)
+
+    def add(self, tweet: dict):
+        self._add_tweet(tweet, False)
+        self._buffered += 1
+        if self._buffered >= self.batch_size:
+            self.flush()
+
+    def write(self, conversation_id: Union[str, int], conversation: List[dict]):
+        '''export the tweets of a conversation, like ConversationWriter.write.'''
+        for tweet in conversation:
+            self.add(tweet)
+
+    def flush(self):
+        '''write the buffered rows, one batch per (non empty) table.'''
+        for tweet, embedded in self._pending["tweets"].values():
+            self._write_tweet(tweet, embedded)
+        for user, partial in self._pending["users"].values():
+            self._write_user(user, partial)
+        self._pending = {"tweets": {}, "users": {}}
+        for table, columns in self._columns.items():
+            if columns[SCHEMAS[table][0][0]]:
+                self._sink.write(table, columns)
+        self._reset()
+        self._buffered = 0
+
+    def close(self):
+        self.flush()
+        self._sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def export_conversations(path: Union[str, pathlib.Path], folder: Union[str, pathlib.Path], **kwargs) -> int:
+    '''export a checkpoint folder or a legacy `*_convo.json` file, one conversation at a time. returns the number of tweets.'''
+    count = 0
+    with ColumnarWriter(folder, **kwargs) as writer:
+        # a conversation can be checkpointed more than once, the later copy wins.
+        for conversation_id, conversation in latest_copies(path, iter_conversations(path)):
+            writer.write(conversation_id, conversation)
+            count += len(conversation)
+    return count
+
+
+# tables whose rows can be written more than once, and the flag of their embedded/partial rows.
+_WEAK_FLAGS = {"tweets": "embedded", "users": "partial"}
+
+def _keep_latest(result: Dict[str, list], flag: str) -> Dict[str, list]:
+    '''one row per id: the last full row, or the last embedded/partial one if there is no full row.'''
+    kept = {} # id -> row index
+    weak = result[flag]
+    for i, key in enumerate(result["id"]):
+        j = kept.get(key)
+        if j is None or not weak[i] or weak[j]:
+            kept[key] = i
+    if len(kept) == len(weak):
+        return result
+    rows = sorted(kept.values())
+    return {name: [values[i] for i in rows] for name, values in result.items()}
+
+
+def read_table(folder: Union[str, pathlib.Path], table: str, columns: Optional[Iterable[str]]=None, dedupe: bool=True) -> Dict[str, list]:
+    '''the `columns` (default: all) of an exported table as lists, nulls as None. only the requested columns are read.
+    parquet timestamps come back as datetimes, npz ones as unix times. with dedupe, tweets and users written more
+    than once (see ColumnarWriter) come back once, in their fullest and latest form.'''
+    columns = list(columns) if columns is not None else [name for name, _ in SCHEMAS[table]]
+    flag = _WEAK_FLAGS.get(table) if dedupe else None
+    names = columns + [name for name in ("id", flag) if flag is not None and name not in columns]
+    result = _read_columns(folder, table, names)
+    if flag is not None:
+        result = _keep_latest(result, flag)
+    return {name: result[name] for name in columns}
+
+
+def _read_columns(folder: Union[str, pathlib.Path], table: str, columns: List[str]) -> Dict[str, list]:
+    kinds = dict(SCHEMAS[table])
+    paths = sorted(glob.glob(os.path.join(folder, table, "part-*")))
+    if any(path.endswith(".parquet") for path in paths):
+        if pq is None:
+            raise ImportError("reading parquet exports needs pyarrow")
+        return pq.read_table(os.path.join(folder, table), columns=columns).to_pydict()
+    if paths and np is None:
+        raise ImportError("reading npz exports needs numpy")
+    result = {name: [] for name in columns}
+    for path in paths:
+        with np.load(path) as part:
+            for name in columns:
+                if kinds[name] == "string":
+                    data, offsets = part[f"{name}.data"].tobytes(), part[f"{name}.offsets"]
+                    values = [data[offsets[i]:offsets[i+1]].decode("utf-8") for i in range(len(offsets) - 1)]
+                else:
+                    values = part[name].tolist()
+                if f"{name}.valid" in part.files:
+                    values = [value if valid else None for value, valid in zip(values, part[f"{name}.valid"].tolist())]
+                result[name].extend(values)
+    return result
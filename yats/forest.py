@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# compact, array backed conversation trees for whole dumps.
+import array
+import pathlib
+from typing import Union, List, Tuple, Iterable, Iterator, Callable, Optional
+try:
+    from .checkpoint import iter_located_conversations, load_conversation_at, latest_copies
+except ImportError:
+    from yats.checkpoint import iter_located_conversations, load_conversation_at, latest_copies
+
+
+class ConversationForest:
+    '''
+    Every conversation of a dump in a handful of contiguous arrays, one entry per tweet (node):
+        ids: tweet ids.
+        parents: index of the node's parent, -1 for roots (and for replies to tweets that weren't scraped).
+        depths: length of the path from the root.
+        reply_counts: the `reply_count` of the tweet, a node is a leaf if it is 0 (like SnscrapeConversationTreeNode.isLeaf).
+        text_offsets: the tweet texts are stored utf-8 encoded back to back, text i is texts[text_offsets[i]:text_offsets[i+1]].
+    The nodes of a conversation are contiguous (conversation_starts) and in the order buildTree puts them in, so
+    leaves/dialogues come out in the same order as from the node trees. Full payloads aren't kept; `payload` loads
+    them from the dump on demand.
+    '''
+    def __init__(self, loader: Optional[Callable[[int], List[dict]]]=None):
+        self.ids = array.array("q")
+        self.parents = array.array("q")
+        self.depths = array.array("l")
+        self.reply_counts = array.array("q")
+        self.text_offsets = array.array("q", [0])
+        self.texts = bytearray()
+        self.conversation_ids = []
+        self.conversation_starts = array.array("q", [0])
+        # conversation index -> its tweets, for payload().
+        self._loader = loader
+        self._loaded = (None, None) # last loaded (conversation index, tweets).
+        self._child_offsets = None
+        self._children = None
+
+    @classmethod
+    def from_conversations(cls, conversations: Iterable[Tuple[str, List[dict]]], loader: Optional[Callable[[int], List[dict]]]=None) -> "ConversationForest":
+        '''build the forest of (conversation_id, tweets) pairs in one pass. every conversation should come once
+        (see checkpoint.latest_copies), a conversation id seen before is skipped. `loader` maps a conversation index back to its tweets, for payload().'''
+        forest = cls(loader)
+        seen = set()
+        for conversation_id, conversation in conversations:
+            if conversation_id in seen: continue
+            seen.add(conversation_id)
+            forest._add(conversation_id, conversation)
+        return forest
+
+    @classmethod
+    def from_path(cls, path: Union[str, pathlib.Path]) -> "ConversationForest":
+        '''forest of a checkpoint folder or a legacy `*_convo.json` file, read one conversation at a time.
+        the later checkpoint of a conversation wins. payloads of checkpoint folders are re-read with a single seek,
+        legacy files are scanned again.'''
+        locations = []
+        def conversations():
+            for conversation_id, conversation, location in latest_copies(path, iter_located_conversations(path)):
+                locations.append(location)
+                yield conversation_id, conversation
+
+        def loader(index: int) -> List[dict]:
+            if locations[index] is not None:
+                return load_conversation_at(locations[index])[1]
+            for i, (_, conversation, _) in enumerate(iter_located_conversations(path)):
+                if i == index:
+                    return conversation
+
+        return cls.from_conversations(conversations(), loader)
+
+    def _add(self, conversation_id: str, conversation: List[dict]):
+        start = len(self.ids)
+        positions = {} # tweet id -> node index, a repeated tweet replaces the earlier one in place (like buildTree).
+        parent_ids = []
+        texts = []
+        for tweet in conversation:
+            text = tweet["text"].encode("utf-8")
+            if tweet["id"] in positions:
+                i = positions[tweet["id"]] - start
+                self.reply_counts[start + i] = int(tweet["reply_count"])
+                parent_ids[i] = tweet["in_reply_to_tweet_id"]
+                texts[i] = text
+                continue
+            positions[tweet["id"]] = start + len(parent_ids)
+            self.ids.append(tweet["id"])
+            self.reply_counts.append(int(tweet["reply_count"]))
+            parent_ids.append(tweet["in_reply_to_tweet_id"])
+            texts.append(text)
+        for text in texts:
+            self.texts += text
+            self.text_offsets.append(len(self.texts))
+        for parent_id in parent_ids:
+            self.parents.append(positions.get(parent_id, -1) if parent_id else -1)
+        # depths, parents can come after their children.
+        depths = [-1] * len(parent_ids)
+        for i in range(len(parent_ids)):
+            path = []
+            node = start + i
+            while node != -1 and depths[node - start] == -1:
+                path.append(node)
+                node = self.parents[node]
+                if len(path) > len(parent_ids):
+                    raise ValueError(f"reply cycle in conversation {conversation_id}")
+            depth = depths[node - start] if node != -1 else -1
+            for node in reversed(path):
+                depth += 1
+                depths[node - start] = depth
+        self.depths.extend(depths)
+        self.conversation_ids.append(conversation_id)
+        self.conversation_starts.append(len(self.ids))
+        self._child_offsets = self._children = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def num_conversations(self) -> int:
+        return len(self.conversation_ids)
+
+    def nbytes(self) -> int:
+        '''memory held by the arrays.'''
+        arrays = (self.ids, self.parents, self.depths, self.reply_counts, self.text_offsets, self.conversation_starts)
+        return sum(a.itemsize * len(a) for a in arrays) + len(self.texts)
+
+    def conversation(self, k: int) -> range:
+        '''node indices of the k-th conversation.'''
+        return range(self.conversation_starts[k], self.conversation_starts[k+1])
+
+    def conversation_of(self, i: int) -> int:
+        '''index of the conversation node i belongs to.'''
+        lo, hi = 0, self.num_conversations
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if self.conversation_starts[mid] <= i:
+                lo = mid
+            else:
+                hi = mid
+        return lo
+
+    def text(self, i: int) -> str:
+        return self.texts[self.text_offsets[i]:self.text_offsets[i+1]].decode("utf-8")
+
+    def is_leaf(self, i: int) -> bool:
+        return self.reply_counts[i] == 0
+
+    def payload(self, i: int) -> dict:
+        '''the full serialized tweet of node i, loaded from the dump.'''
+        if self._loader is None:
+            raise ValueError("this forest has no loader for payloads")
+        k = self.conversation_of(i)
+        if self._loaded[0] != k:
+            tweets = {}
+            for tweet in self._loader(k):
+                tweets[tweet["id"]] = tweet
+            self._loaded = (k, tweets)
+        return self._loaded[1][self.ids[i]]
+
+    def _index_children(self):
+        '''children of every node as one array (CSR), built on first use.'''
+        counts = array.array("q", bytes(8 * (len(self) + 1)))
+        for parent in self.parents:
+            if parent != -1:
+                counts[parent + 1] += 1
+        for i in range(len(self)):
+            counts[i + 1] += counts[i]
+        children = array.array("q", bytes(8 * counts[-1]))
+        fill = array.array("q", counts)
+        for i, parent in enumerate(self.parents):
+            if parent != -1:
+                children[fill[parent]] = i
+                fill[parent] += 1
+        self._child_offsets, self._children = counts, children
+
+    def children(self, i: int) -> array.array:
+        '''indices of the children of node i, in node order.'''
+        if self._children is None:
+            self._index_children()
+        return self._children[self._child_offsets[i]:self._child_offsets[i+1]]
+
+    def roots(self, k: Optional[int]=None) -> Iterator[int]:
+        '''roots of the k-th conversation, or of all of them.'''
+        nodes = range(len(self)) if k is None else self.conversation(k)
+        return (i for i in nodes if self.parents[i] == -1)
+
+    def leaves(self, k: Optional[int]=None) -> Iterator[int]:
+        nodes = range(len(self)) if k is None else self.conversation(k)
+        return (i for i in nodes if self.reply_counts[i] == 0)
+
+    def path_to_root(self, i: int) -> List[int]:
+        '''node indices from i up to its root (the order of SnscrapeConversationTreeNode.pathToRoot).'''
+        path = []
+        while i != -1:
+            path.append(i)
+            i = self.parents[i]
+        return path
+
+    def dialogue(self, i: int) -> List[str]:
+        '''texts from the root down to node i (SnscrapeConversationTreeNode.tolist).'''
+        return [self.text(node) for node in reversed(self.path_to_root(i))]
+
+    def dialogues(self, min_length: int=2) -> Iterator[List[str]]:
+        '''root to leaf dialogues of every conversation with at least `min_length` utterances, in the order extract_dialogues
+        writes them: every tree is walked depth first like tree.iter_dialogues, keeping the current root to node path.'''
+        for root in self.roots():
+            path = []
+            stack = [root]
+            while stack:
+                i = stack.pop()
+                del path[self.depths[i]:]
+                path.append(self.text(i))
+                if self.reply_counts[i] == 0 and len(path) >= min_length:
+                    yield list(path)
+                stack.extend(reversed(self.children(i)))
+
+    def subtree_stats(self) -> dict:
+        '''per node statistics of every conversation at once, as arrays indexed like the nodes:
+            heights: length of the longest path down to a node without children.
+            sizes: number of nodes in the subtree.
+            fanouts: number of fetched children.
+            leaf_counts: number of nodes without (fetched) children in the subtree.
+            missing_replies: replies the tweet reports (reply_count) that weren't fetched.
+        nodes are visited deepest first (a counting sort of the depths), so every node is final before its parent
+        reads it: O(n), no recursion and no per node objects.'''
+        n = len(self)
+        fanouts = array.array("q", bytes(8 * n))
+        for parent in self.parents:
+            if parent != -1:
+                fanouts[parent] += 1
+        max_depth = max(self.depths, default=-1)
+        starts = array.array("q", bytes(8 * (max_depth + 2)))
+        for depth in self.depths:
+            starts[depth + 1] += 1
+        for depth in range(max_depth + 1):
+            starts[depth + 1] += starts[depth]
+        order = array.array("q", bytes(8 * n))
+        for i, depth in enumerate(self.depths):
+            order[starts[depth]] = i
+            starts[depth] += 1
+        heights = array.array("q", bytes(8 * n))
+        sizes = array.array("q", [1]) * n
+        leaf_counts = array.array("q", (fanout == 0 for fanout in fanouts))
+        for i in reversed(order):
+            parent = self.parents[i]
+            if parent == -1: continue
+            sizes[parent] += sizes[i]
+            leaf_counts[parent] += leaf_counts[i]
+            if heights[i] >= heights[parent]:
+                heights[parent] = heights[i] + 1
+        missing_replies = array.array("q", (max(0, count - fanout) for count, fanout in zip(self.reply_counts, fanouts)))
+        return {"heights": heights, "sizes": sizes, "fanouts": fanouts, "leaf_counts": leaf_counts, "missing_replies": missing_replies}
+
+    def summary(self) -> Iterator[dict]:
+        '''one row per conversation: its size, shape and the replies that weren't fetched (re-crawl candidates).'''
+        stats = self.subtree_stats()
+        for k, conversation_id in enumerate(self.conversation_ids):
+            nodes = self.conversation(k)
+            roots = [i for i in nodes if self.parents[i] == -1]
+            yield {
+                "conversation_id": conversation_id,
+                "nodes": len(nodes),
+                "roots": len(roots),
+                "height": max((stats["heights"][i] for i in roots), default=0),
+                "max_fanout": max((stats["fanouts"][i] for i in nodes), default=0),
+                "leaves": sum(stats["leaf_counts"][i] for i in roots),
+                "missing_replies": sum(stats["missing_replies"][i] for i in nodes),
+            }
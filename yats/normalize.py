@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# normalized (users stored once) form of serialized tweets.
+from typing import Union, List, Dict, Iterable
+
+# embedded objects of a serialized tweet and the keys their ids are stored under in normalized rows.
+_REFS = {
+    "username": "user_id",
+    "in_reply_to_user": "in_reply_to_user_id",
+    "mentioned_users": "mentioned_user_ids",
+    "retweeted_tweet": "retweeted_tweet_id",
+    "quoted_tweet": "quoted_tweet_id",
+}
+
+
+def _is_partial(user: dict) -> bool:
+    # mentioned users and reply targets other than the author only have a username, an id and maybe a display name.
+    return user["followers_count"] is None
+
+
+class Normalizer:
+    '''
+    Builds the normalized form of serialized tweets one tweet at a time:
+        users: full profiles (tweet authors), once per user; the first profile seen is kept, the latest with `latest`.
+        mentioned_users: partial users (mentions, reply targets), once per user.
+        tweets: the tweets that were added, in order, with users and embedded tweets replaced by their ids
+            (`username` -> `user_id`, `in_reply_to_user` -> `in_reply_to_user_id`, `mentioned_users` ->
+            `mentioned_user_ids`, `retweeted_tweet` -> `retweeted_tweet_id`, `quoted_tweet` -> `quoted_tweet_id`).
+        embedded_tweets: retweeted/quoted tweets, normalized the same way (first or latest copy, like users).
+    '''
+    def __init__(self, latest: bool=False):
+        self.latest = latest
+        self.users = {} # id -> user
+        self.mentioned_users = {} # id -> partial user
+        self.tweets = []
+        self.embedded_tweets = {} # id -> tweet
+
+    def _user_id(self, user: Union[dict, None]):
+        if user is None:
+            return None
+        table = self.mentioned_users if _is_partial(user) else self.users
+        if self.latest or user["id"] not in table:
+            table[user["id"]] = user
+        return user["id"]
+
+    def _tweet_id(self, tweet: Union[dict, None]):
+        if tweet is None:
+            return None
+        if self.latest or tweet["id"] not in self.embedded_tweets:
+            self.embedded_tweets[tweet["id"]] = self._row(tweet)
+        return tweet["id"]
+
+    def _row(self, tweet: dict) -> dict:
+        row = {}
+        for key, value in tweet.items():
+            if key == "mentioned_users":
+                row[_REFS[key]] = [self._user_id(user) for user in value] if value is not None else None
+            elif key in ("username", "in_reply_to_user"):
+                row[_REFS[key]] = self._user_id(value)
+            elif key in ("retweeted_tweet", "quoted_tweet"):
+                row[_REFS[key]] = self._tweet_id(value)
+            else:
+                row[key] = value
+        return row
+
+    def add(self, tweet: dict):
+        self.tweets.append(self._row(tweet))
+
+    def table(self) -> Dict[str, list]:
+        return {
+            "users": list(self.users.values()),
+            "mentioned_users": list(self.mentioned_users.values()),
+            "tweets": self.tweets,
+            "embedded_tweets": list(self.embedded_tweets.values()),
+        }
+
+
+def normalize(tweets: Iterable[dict]) -> Dict[str, list]:
+    '''normalized form of a list of serialized tweets (see Normalizer).'''
+    normalizer = Normalizer()
+    for tweet in tweets:
+        normalizer.add(tweet)
+    return normalizer.table()
+
+def denormalize(table: Dict[str, list]) -> List[dict]:
+    '''the serialized tweets of a normalized table. a user seen with several profiles (e.g. follower counts that
+    changed while scraping) gets the one kept in the table everywhere: the round trip is lossy for user snapshots.'''
+    users = {user["id"]: user for user in table["users"]}
+    mentioned_users = {user["id"]: user for user in table["mentioned_users"]}
+    embedded_tweets = {tweet["id"]: tweet for tweet in table["embedded_tweets"]}
+    keys = {ref: key for key, ref in _REFS.items()}
+
+    def expand(row: dict) -> dict:
+        tweet = {}
+        for ref, value in row.items():
+            key = keys.get(ref, ref)
+            if value is None or key == ref:
+                tweet[key] = value
+            elif key == "username":
+                tweet[key] = dict(users[value])
+            elif key == "in_reply_to_user":
+                # like the scraper: a reply to oneself carries the full profile, other reply targets are partial.
+                tweet[key] = dict(users[value] if value == row["user_id"] else mentioned_users[value])
+            elif key == "mentioned_users":
+                tweet[key] = [dict(mentioned_users[user_id]) for user_id in value]
+            else:
+                tweet[key] = expand(embedded_tweets[value])
+        return tweet
+
+    return [expand(row) for row in table["tweets"]]
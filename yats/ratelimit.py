@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# request pacing based on the x-rate-limit-* response headers.
+import re
+import time
+import asyncio
+import threading
+import urllib.parse
+from typing import Union, Dict, Tuple, Optional
+
+
+class _Budget:
+    def __init__(self, limit: Optional[int], remaining: int, reset: float):
+        self.limit = limit
+        self.remaining = remaining
+        self.reset = reset # unix time at which the window resets.
+        self.next = 0.0 # earliest unix time for the next paced request.
+
+
+class RateLimiter:
+    '''
+    Keeps the request budget twitter reports (`x-rate-limit-remaining`/`x-rate-limit-reset`) for every
+    (endpoint, guest token) pair, and spaces requests so that the remaining budget lasts until the window
+    resets instead of running into 429s. Endpoints are normalised, so that e.g. every
+    `timeline/conversation/<id>.json` request counts against the same budget.
+    '''
+    def __init__(self, reserve: int=1):
+        # number of requests per window that are kept back, e.g. for retries.
+        self.reserve_requests = reserve
+        self._budgets = {} # (endpoint, token) -> _Budget
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def endpoint(url: str) -> str:
+        '''normalise a request url to the endpoint its rate limit applies to.'''
+        parts = urllib.parse.urlsplit(url)
+        # tweet/user ids in the path, not short numbers like the api version.
+        path = re.sub(r"/\d{5,}(?=/|\.json$|$)", "/{id}", parts.path)
+        return f"{parts.netloc}{path}"
+
+    def update(self, url: str, token: Union[str, None], headers) -> None:
+        '''record the budget reported by a response.'''
+        try:
+            remaining = int(headers["x-rate-limit-remaining"])
+            reset = float(headers["x-rate-limit-reset"])
+        except (KeyError, TypeError, ValueError):
+            return
+        try:
+            limit = int(headers["x-rate-limit-limit"])
+        except (KeyError, TypeError, ValueError):
+            limit = None
+        key = (self.endpoint(url), token)
+        with self._lock:
+            budget = self._budgets.get(key)
+            if budget is None or budget.reset != reset:
+                self._budgets[key] = _Budget(limit, remaining, reset)
+            else:
+                # responses can arrive out of order, the smallest remaining count is the most recent one.
+                budget.remaining = min(budget.remaining, remaining)
+
+    def delay(self, url: str, token: Union[str, None]) -> float:
+        '''reserve a request slot and return how many seconds to wait before sending it.'''
+        return self._delay(url, token, reserve=True)
+
+    def peek(self, url: str, token: Union[str, None]) -> float:
+        '''seconds until the next paced request slot, without reserving it (retries use the reserve_requests).'''
+        return self._delay(url, token, reserve=False)
+
+    def _delay(self, url: str, token: Union[str, None], reserve: bool) -> float:
+        key = (self.endpoint(url), token)
+        now = time.time()
+        with self._lock:
+            budget = self._budgets.get(key)
+            if budget is None:
+                return 0.0
+            if now >= budget.reset:
+                # the window has reset, wait for the next response to learn the new budget.
+                del self._budgets[key]
+                return 0.0
+            if budget.remaining <= self.reserve_requests:
+                return budget.reset - now
+            start = max(now, budget.next)
+            if reserve:
+                budget.next = start + (budget.reset - now) / (budget.remaining - self.reserve_requests)
+                budget.remaining -= 1
+            return start - now
+
+    def wait(self, url: str, token: Union[str, None]) -> None:
+        seconds = self.delay(url, token)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    async def await_slot(self, url: str, token: Union[str, None]) -> None:
+        '''asyncio variant of wait.'''
+        seconds = self.delay(url, token)
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    def remaining(self, url: str, token: Union[str, None]=None) -> Optional[int]:
+        '''requests left in the current window for `url`'s endpoint, summed over all tokens if `token` is None.
+        returns None if no response for that endpoint reported a budget yet.'''
+        endpoint = self.endpoint(url)
+        now = time.time()
+        total = None
+        with self._lock:
+            for (key_endpoint, key_token), budget in self._budgets.items():
+                if key_endpoint != endpoint or budget.reset <= now:
+                    continue
+                if token is not None and key_token != token:
+                    continue
+                total = (total or 0) + budget.remaining
+        return total
+
+    def budgets(self) -> Dict[Tuple[str, Union[str, None]], Tuple[int, float]]:
+        '''(endpoint, token) -> (remaining requests, reset time) for every window that is still open.'''
+        now = time.time()
+        with self._lock:
+            return {key: (budget.remaining, budget.reset) for key, budget in self._budgets.items() if budget.reset > now}
+
+
+_default_limiter = None
+_default_limiter_lock = threading.Lock()
+
+def default_limiter() -> RateLimiter:
+    '''the limiter shared by all scrapers that weren't given one explicitly.'''
+    global _default_limiter
+    with _default_limiter_lock:
+        if _default_limiter is None:
+            _default_limiter = RateLimiter()
+        return _default_limiter
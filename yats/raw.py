@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# serialize twitter API json straight to the TweetSerializer output, without building Tweet/User objects.
+import re
+import logging
+import functools
+import itertools
+from typing import List, Union
+try:
+    from .utils import datetime_to_datedict, created_at_to_datedict, created_at_to_epoch
+    from .snscrape import UserLabel
+except ImportError:
+    from yats.utils import datetime_to_datedict, created_at_to_datedict, created_at_to_epoch
+    from yats.snscrape import UserLabel
+
+logger = logging.getLogger(__name__)
+_SOURCE_URL = re.compile(r'href=[\'"]?([^\'" >]+)')
+_SOURCE_LABEL = re.compile(r'>([^<]*)<')
+# date of users whose creation date isn't known.
+_NO_DATE = datetime_to_datedict(None)
+# users show up on many pages, their (immutable) creation dates are cached.
+_cached_created_at_to_datedict = functools.lru_cache(maxsize=2**16)(created_at_to_datedict)
+_cached_created_at_to_epoch = functools.lru_cache(maxsize=2**16)(created_at_to_epoch)
+
+
+def render_text_with_urls(text: str, urls: Union[List[dict], None]) -> str:
+    '''replace the t.co links in `text` by their display urls (same as TwitterAPIScraper._render_text_with_urls).'''
+    if not urls:
+        return text
+    out = [text[:urls[0]['indices'][0]]]
+    assert all(url['indices'][1] <= next_url['indices'][0] for url, next_url in zip(urls, urls[1:])), 'broken URL indices'
+    for url, next_url in itertools.zip_longest(urls, urls[1:]):
+        if 'display_url' in url:
+            out.append(url['display_url'])
+        out.append(text[url['indices'][1] : next_url['indices'][0] if next_url is not None else None])
+    return ''.join(out)
+
+
+class RawTweetSerializer:
+    '''
+    Maps a tweet of an API page (`obj['globalObjects']['tweets'][...]`) to exactly the dict
+    TweetSerializer()(TwitterAPIScraper._tweet_to_tweet(tweet, obj)) returns, skipping the Tweet/User/Medium objects.
+    Instances can be passed to the scrapers as `tweetFactory`, so that they yield serialized tweets.
+    Users are serialized once per page; every tweet gets its own copy of the user dict, but nested values
+    (`created`, `description_urls`) are shared between the tweets of a page.
+    With `epoch_dates`, dates are unix times in seconds instead of date dicts, like TweetSerializer(epoch_dates=True).
+    '''
+    def __init__(self, epoch_dates: bool=False, **kwargs):
+        self.epoch_dates = epoch_dates
+        self._page_users = (None, {}) # (page, user_id_str -> serialized user) of the page being converted.
+
+    def __call__(self, tweet: dict, obj: dict) -> dict:
+        '''serialize tweet, `obj` is the API page it came from.'''
+        raw_user = obj['globalObjects']['users'][tweet['user_id_str']]
+        entities = tweet['entities']
+        tweet_id = tweet['id'] if 'id' in tweet else int(tweet['id_str'])
+        user = self._page_user(tweet['user_id_str'], obj)
+        source = tweet['source']
+        match_url = _SOURCE_URL.search(source)
+        match_label = _SOURCE_LABEL.search(source)
+        urls = entities.get('urls')
+        mentions = entities.get('user_mentions')
+        JSON = {}
+        JSON["id"] = tweet_id
+        JSON["url"] = f'https://twitter.com/{raw_user["screen_name"]}/status/{tweet_id}'
+        JSON["date"] = created_at_to_epoch(tweet['created_at']) if self.epoch_dates else created_at_to_datedict(tweet['created_at'])
+        JSON["text"] = tweet['full_text']
+        JSON["username"] = user
+        JSON["reply_count"] = tweet['reply_count']
+        JSON["retweet_count"] = tweet['retweet_count']
+        JSON["like_count"] = tweet['favorite_count']
+        JSON["quote_count"] = tweet['quote_count']
+        JSON["conversation_id"] = tweet['conversation_id'] if 'conversation_id' in tweet else int(tweet['conversation_id_str'])
+        JSON["lang"] = tweet['lang']
+        JSON["source"] = source
+        JSON["source_url"] = match_url.group(1) if match_url else None
+        JSON["source_label"] = match_label.group(1) if match_label else None
+        JSON["outlinks"] = [u['expanded_url'] for u in urls] if urls else None
+        JSON["tcooutlinks"] = [u['url'] for u in urls] if urls else None
+        JSON["media"] = self._media(tweet, tweet_id)
+        if 'retweeted_status_id_str' in tweet:
+            JSON["retweeted_tweet"] = self(obj['globalObjects']['tweets'][tweet['retweeted_status_id_str']], obj)
+        else:
+            JSON["retweeted_tweet"] = None
+        if 'quoted_status_id_str' in tweet and tweet['quoted_status_id_str'] in obj['globalObjects']['tweets']:
+            JSON["quoted_tweet"] = self(obj['globalObjects']['tweets'][tweet['quoted_status_id_str']], obj)
+        else:
+            JSON["quoted_tweet"] = None
+        in_reply_to_user = None
+        if (in_reply_to_tweet_id := tweet.get('in_reply_to_status_id_str')):
+            JSON["in_reply_to_tweet_id"] = int(in_reply_to_tweet_id)
+            in_reply_to_user_id = int(tweet['in_reply_to_user_id_str'])
+            if in_reply_to_user_id == user["id"]:
+                in_reply_to_user = dict(user)
+            elif mentions:
+                # the last matching mention wins, like in _tweet_to_tweet.
+                for u in mentions:
+                    if u['id_str'] == tweet['in_reply_to_user_id_str']:
+                        in_reply_to_user = self._partial_user(u['screen_name'], u['id'] if 'id' in u else int(u['id_str']), u['name'])
+            if in_reply_to_user is None:
+                in_reply_to_user = self._partial_user(tweet['in_reply_to_screen_name'], in_reply_to_user_id)
+        else:
+            JSON["in_reply_to_tweet_id"] = None
+        JSON["in_reply_to_user"] = in_reply_to_user
+        if mentions:
+            JSON["mentioned_users"] = [self._partial_user(u['screen_name'], u['id'] if 'id' in u else int(u['id_str']), u['name']) for u in mentions]
+        else:
+            JSON["mentioned_users"] = None
+        JSON["coordinates"], JSON["place"] = self._location(tweet)
+        JSON["hashtags"] = [o['text'] for o in entities['hashtags']] if entities.get('hashtags') else None
+        JSON["cashtags"] = [o['text'] for o in entities['symbols']] if entities.get('symbols') else None
+
+        return JSON
+
+    def _page_user(self, user_id_str: str, obj: dict) -> dict:
+        # a single tuple is swapped in, so that threads sharing this serializer at worst miss the cache.
+        page, users = self._page_users
+        if page is not obj:
+            users = {}
+            self._page_users = (obj, users)
+        if user_id_str not in users:
+            users[user_id_str] = self._user(obj['globalObjects']['users'][user_id_str])
+        return dict(users[user_id_str])
+
+    def _user(self, user: dict) -> dict:
+        '''serialized user of a `globalObjects` user.'''
+        entities = user['entities']
+        description_urls = entities['description'].get('urls')
+        JSON = {}
+        JSON["id"] = user['id'] if 'id' in user else int(user['id_str'])
+        JSON["username"] = user['screen_name']
+        JSON["verified"] = user.get('verified')
+        JSON["description"] = render_text_with_urls(user['description'], description_urls)
+        JSON["displayname"] = user['name']
+        JSON["raw_description"] = user['description']
+        if description_urls:
+            JSON["description_urls"] = [{'text': x.get('display_url'), 'url': x['expanded_url'], 'tcourl': x['url'], 'indices': tuple(x['indices'])} for x in description_urls]
+        else:
+            JSON["description_urls"] = None
+        if self.epoch_dates:
+            JSON["created"] = _cached_created_at_to_epoch(user['created_at'])
+        else:
+            JSON["created"] = dict(_cached_created_at_to_datedict(user['created_at']))
+        JSON["followers_count"] = user['followers_count']
+        JSON["friends_count"] = user['friends_count']
+        JSON["statusesCount"] = user['statuses_count']
+        JSON["favourites_count"] = user['favourites_count']
+        JSON["listed_count"] = user['listed_count']
+        JSON["media_count"] = user['media_count']
+        JSON["location"] = user['location']
+        JSON["protected"] = user.get('protected')
+        JSON["link_url"] = (entities['url']['urls'][0].get('expanded_url') or user.get('url')) if 'url' in entities else None
+        JSON["link_tcourl"] = user.get('url')
+        JSON["profile_image_url"] = user['profile_image_url_https']
+        JSON["profile_banner_url"] = user.get('profile_banner_url')
+        label = user['ext']['highlightedLabel']['r']['ok'].get('label') if 'ext' in user else None
+        JSON["label"] = self._label(label) if label else None
+
+        return JSON
+
+    def _partial_user(self, username: str, id: int, displayname: Union[str, None]=None) -> dict:
+        '''serialized user that only has a username, an id and maybe a display name (mentions, reply targets).'''
+        return {
+            "id": id, "username": username, "verified": None, "description": None, "displayname": displayname,
+            "raw_description": None, "description_urls": None, "created": None if self.epoch_dates else dict(_NO_DATE),
+            "followers_count": None, "friends_count": None, "statusesCount": None, "favourites_count": None,
+            "listed_count": None, "media_count": None, "location": None, "protected": None, "link_url": None,
+            "link_tcourl": None, "profile_image_url": None, "profile_banner_url": None, "label": None,
+        }
+
+    def _label(self, label: dict) -> UserLabel:
+        # TweetSerializer passes the UserLabel object through as it is.
+        kwargs = {}
+        kwargs['description'] = label['description']
+        if 'url' in label and 'url' in label['url']:
+            kwargs['url'] = label['url']['url']
+        if 'badge' in label and 'url' in label['badge']:
+            kwargs['badgeUrl'] = label['badge']['url']
+        if 'longDescription' in label and 'text' in label['longDescription']:
+            kwargs['longDescription'] = label['longDescription']['text']
+        return UserLabel(**kwargs)
+
+    def _media(self, tweet: dict, tweet_id: int) -> List[dict]:
+        JSON = []
+        if 'extended_entities' not in tweet or 'media' not in tweet['extended_entities']:
+            return JSON
+        for medium in tweet['extended_entities']['media']:
+            if medium['type'] == 'photo':
+                if '.' not in medium['media_url_https']:
+                    logger.warning(f'Skipping malformed medium URL on tweet {tweet_id}: {medium["media_url_https"]!r} contains no dot')
+                    continue
+                base_url, format = medium['media_url_https'].rsplit('.', 1)
+                if format not in ('jpg', 'png'):
+                    logger.warning(f'Skipping photo with unknown format on tweet {tweet_id}: {format!r}')
+                    continue
+                JSON.append({
+                    "preview_url": f'{base_url}?format={format}&name=small',
+                    "full_url": f'{base_url}?format={format}&name=large',
+                })
+            elif medium['type'] == 'video' or medium['type'] == 'animated_gif':
+                variants = [{
+                    "url": variant['url'],
+                    "bitrate": variant.get('bitrate'),
+                    "content_type": variant['content_type'],
+                } for variant in medium['video_info']['variants']]
+                if medium['type'] == 'video':
+                    views = None
+                    if (ext := medium['ext']) and (media_stats := ext['mediaStats']) and isinstance(r := media_stats['r'], dict) and 'ok' in r and isinstance(r['ok'], dict):
+                        views = int(r['ok']['viewCount'])
+                    JSON.append({
+                        "thumbnail_url": medium['media_url_https'],
+                        "variants": variants,
+                        "duration": medium['video_info']['duration_millis'] / 1000,
+                        "views": views,
+                    })
+                else:
+                    JSON.append({"thumbnail_url": medium['media_url_https'], "variants": variants})
+
+        return JSON
+
+    def _location(self, tweet: dict):
+        '''(coordinates, place) of a tweet, see _tweet_to_tweet for the precedence rules.'''
+        coordinates, place = None, None
+        if tweet.get('coordinates'):
+            # [longitude, latitude]
+            if (coords := tweet['coordinates']['coordinates']) and len(coords) == 2:
+                coordinates = {"longitude": coords[0], "latitude": coords[1]}
+        elif tweet.get('geo'):
+            # [latitude, longitude]
+            if (coords := tweet['geo']['coordinates']) and len(coords) == 2:
+                coordinates = {"longitude": coords[1], "latitude": coords[0]}
+        if tweet.get('place'):
+            raw_place = tweet['place']
+            place = {
+                "full_name": raw_place['full_name'],
+                "name": raw_place['name'],
+                "type": raw_place['place_type'],
+                "country": raw_place['country'],
+                "country_code": raw_place['country_code'],
+            }
+            if coordinates is None and raw_place['bounding_box'] and (coords := raw_place['bounding_box']['coordinates']) and coords[0] and len(coords[0][0]) == 2:
+                # the first (longitude, latitude) couple of the place's bounding box.
+                coordinates = {"longitude": coords[0][0][0], "latitude": coords[0][0][1]}
+
+        return coordinates, place
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# persistent index of the tweets and conversations scraped in earlier runs.
+import os
+import time
+import sqlite3
+import pathlib
+import threading
+from typing import Union, Iterable, List, Optional, Set, Tuple
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tweets (
+    id INTEGER PRIMARY KEY,
+    parent INTEGER,
+    reply_count INTEGER NOT NULL DEFAULT 0,
+    conversation TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tweets_parent ON tweets (parent);
+CREATE INDEX IF NOT EXISTS tweets_conversation ON tweets (conversation);
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    finished REAL NOT NULL,
+    num_tweets INTEGER NOT NULL
+);
+'''
+# sqlite limits the number of host parameters of a statement.
+_BATCH = 500
+
+
+class SeenIndex:
+    '''
+    Conversations scraped by earlier runs, kept in a small sqlite database so re-crawls can skip them:
+        conversations: conversations fetched completely and stored by the caller.
+        tweets: the tweets of these conversations (id, the tweet replied to, reply count). all their replies are
+            known too, so TwitterTweetScraper's RECURSE mode doesn't yield a known tweet again and continues below
+            it from its known replies instead of fetching them again.
+    Nothing is recorded while a conversation is being fetched: finish_conversation is only called once the caller
+    has stored the whole conversation (see SNScrapeWrapper.remember), so a run that dies halfway leaves no trace
+    and whatever the index skips is stored somewhere already.
+    It can be shared by the threads of SNScrapeWrapper.conversations; every call is its own transaction.
+    '''
+    def __init__(self, path: Union[str, pathlib.Path]):
+        self.path = path
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def _write(self, *statements: Tuple[str, Iterable[tuple]]):
+        '''run (sql, rows) statements in one transaction.'''
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                for sql, rows in statements:
+                    self._db.executemany(sql, rows)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def has_tweet(self, tweet_id: Union[int, str]) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM tweets WHERE id = ?", (int(tweet_id),)).fetchone() is not None
+
+    def known_tweets(self, tweet_ids: Iterable[Union[int, str]]) -> Set[int]:
+        '''the subset of `tweet_ids` seen before.'''
+        tweet_ids = [int(tweet_id) for tweet_id in tweet_ids]
+        known = set()
+        with self._lock:
+            for start in range(0, len(tweet_ids), _BATCH):
+                batch = tweet_ids[start:start + _BATCH]
+                rows = self._db.execute(f"SELECT id FROM tweets WHERE id IN ({','.join('?' * len(batch))})", batch)
+                known.update(row[0] for row in rows)
+        return known
+
+    def replies(self, tweet_id: Union[int, str]) -> List[Tuple[int, Optional[int], int]]:
+        '''the known direct replies of a tweet, as (tweet id, id of the tweet it replies to, reply count) triples.'''
+        with self._lock:
+            return self._db.execute("SELECT id, parent, reply_count FROM tweets WHERE parent = ? ORDER BY id", (int(tweet_id),)).fetchall()
+
+    def is_finished(self, conversation_id: Union[int, str]) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM conversations WHERE id = ?", (str(conversation_id),)).fetchone() is not None
+
+    def finish_conversation(self, conversation_id: Union[int, str], tweets: Iterable[Tuple[int, Optional[int], int]]):
+        '''record a stored conversation and its (tweet id, id of the tweet it replies to or None, reply count) triples.'''
+        conversation_id = str(conversation_id)
+        tweets = [(int(tweet_id), parent_id, reply_count, conversation_id) for tweet_id, parent_id, reply_count in tweets]
+        self._write(
+            ("INSERT OR REPLACE INTO tweets VALUES (?, ?, ?, ?)", tweets),
+            ("INSERT OR REPLACE INTO conversations VALUES (?, ?, ?)", [(conversation_id, time.time(), len(tweets))]),
+        )
+
+    def forget_conversation(self, conversation_id: Union[int, str]):
+        '''fetch the conversation again (completely) next time.'''
+        self._write(
+            ("DELETE FROM tweets WHERE conversation = ?", [(str(conversation_id),)]),
+            ("DELETE FROM conversations WHERE id = ?", [(str(conversation_id),)]),
+        )
+
+    def num_tweets(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM tweets").fetchone()[0]
+
+    def num_conversations(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
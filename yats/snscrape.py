@@ -1,3 +1,4 @@
+import asyncio
 import collections
 import dataclasses
 import datetime
@@ -9,6 +10,11 @@ import random
 import logging
 import re
 import yats.base
+import yats.checkpoint
+import yats.ratelimit
+import yats.seen
+import yats.tokens
+import yats.utils
 import string
 import time
 import typing
@@ -19,6 +25,7 @@ logger = logging.getLogger(__name__)
 _API_AUTHORIZATION_HEADER = 'Bearer AAAAAAAAAAAAAAAAAAAAANRILgAAAAAAnNwIzUejRCOuH5E6I8xnZz4puTs=1Zv7ttfk8LF81IUq16cHjhLTvJu4FA33AGWWjCpTnA'
 
 
+@yats.base._add_slots
 @dataclasses.dataclass
 class Tweet(yats.base.Item):
 	url: str
@@ -58,15 +65,17 @@ class Tweet(yats.base.Item):
 
 
 class Medium:
-	pass
+	__slots__ = ()
 
 
+@yats.base._add_slots
 @dataclasses.dataclass
 class Photo(Medium):
 	previewUrl: str
 	fullUrl: str
 
 
+@yats.base._add_slots
 @dataclasses.dataclass
 class VideoVariant:
 	contentType: str
@@ -74,6 +83,7 @@ class VideoVariant:
 	bitrate: typing.Optional[int]
 
 
+@yats.base._add_slots
 @dataclasses.dataclass
 class Video(Medium):
 	thumbnailUrl: str
@@ -82,6 +92,7 @@ class Video(Medium):
 	views: typing.Optional[int] = None
 
 
+@yats.base._add_slots
 @dataclasses.dataclass
 class Gif(Medium):
 	thumbnailUrl: str
@@ -96,12 +107,14 @@ class DescriptionURL:
 	indices: typing.Tuple[int, int]
 
 
+@yats.base._add_slots
 @dataclasses.dataclass
 class Coordinates:
 	longitude: float
 	latitude: float
 
 
+@yats.base._add_slots
 @dataclasses.dataclass
 class Place:
 	fullName: str
@@ -111,6 +124,7 @@ class Place:
 	countryCode: str
 
 
+@yats.base._add_slots
 @dataclasses.dataclass
 class User(yats.base.Entity):
 	# Most fields can be None if they're not known.
@@ -169,11 +183,116 @@ class ScrollDirection(enum.Enum):
 	BOTH = enum.auto()
 
 
+class _Pagination:
+	'''Cursor state of a scroll over a timeline endpoint, advanced page by page by TwitterAPIScraper._iter_api_data and _aiter_api_data.'''
+
+	# Logic for dual scrolling: direction is set to top, but if the bottom cursor is found, bottomCursorAndStop is set accordingly.
+	# Once the top pagination is exhausted, the bottomCursorAndStop is used and reset to None; it isn't set anymore after because the first entry condition will always be true for the bottom cursor.
+
+	def __init__(self, scraper, params, paginationParams, cursor, direction):
+		self._scraper = scraper
+		self._paginationParams = paginationParams
+		self._direction = direction
+		self.cursor = cursor
+		if cursor is None:
+			self.reqParams = params
+		else:
+			self.reqParams = paginationParams.copy()
+			self.reqParams['cursor'] = cursor
+		self.bottomCursorAndStop = None
+		if direction is ScrollDirection.TOP or direction is ScrollDirection.BOTH:
+			self.dir = 'top'
+		else:
+			self.dir = 'bottom'
+		self.stopOnEmptyResponse = False
+		self.emptyResponsesOnCursor = 0
+		self.done = False
+
+	def state(self):
+		'''JSON-serialisable snapshot of the cursor state, see restore.'''
+		return {
+			'cursor': self.cursor,
+			'dir': self.dir,
+			'bottomCursorAndStop': self.bottomCursorAndStop,
+			'stopOnEmptyResponse': self.stopOnEmptyResponse,
+			'emptyResponsesOnCursor': self.emptyResponsesOnCursor,
+			'done': self.done,
+		}
+
+	def restore(self, state):
+		'''Continue a pagination from a snapshot taken by state, e.g. in a previous run.'''
+		self.cursor = state['cursor']
+		self.dir = state['dir']
+		self.bottomCursorAndStop = tuple(state['bottomCursorAndStop']) if state['bottomCursorAndStop'] is not None else None
+		self.stopOnEmptyResponse = state['stopOnEmptyResponse']
+		self.emptyResponsesOnCursor = state['emptyResponsesOnCursor']
+		self.done = state['done']
+		if self.cursor is not None:
+			self.reqParams = self._paginationParams.copy()
+			self.reqParams['cursor'] = self.cursor
+
+	def advance(self, obj):
+		'''Consume a retrieved page and either prepare the request parameters of the next page or mark the pagination as done.'''
+		# No data format test, just a hard and loud crash if anything's wrong :-)
+		newCursor = None
+		promptCursor = None
+		newBottomCursorAndStop = None
+		for instruction in obj['timeline']['instructions']:
+			if 'addEntries' in instruction:
+				entries = instruction['addEntries']['entries']
+			elif 'replaceEntry' in instruction:
+				entries = [instruction['replaceEntry']['entry']]
+			else:
+				continue
+			for entry in entries:
+				if entry['entryId'] == f'sq-cursor-{self.dir}' or entry['entryId'].startswith(f'cursor-{self.dir}-'):
+					newCursor = entry['content']['operation']['cursor']['value']
+					if 'stopOnEmptyResponse' in entry['content']['operation']['cursor']:
+						self.stopOnEmptyResponse = entry['content']['operation']['cursor']['stopOnEmptyResponse']
+				elif entry['entryId'].startswith('cursor-showMoreThreadsPrompt-'): # E.g. 'offensive' replies button
+					promptCursor = entry['content']['operation']['cursor']['value']
+				elif self._direction is ScrollDirection.BOTH and self.bottomCursorAndStop is None and (entry['entryId'] == f'sq-cursor-bottom' or entry['entryId'].startswith('cursor-bottom-')):
+					newBottomCursorAndStop = (entry['content']['operation']['cursor']['value'], entry['content']['operation']['cursor'].get('stopOnEmptyResponse', False))
+		if self.bottomCursorAndStop is None and newBottomCursorAndStop is not None:
+			self.bottomCursorAndStop = newBottomCursorAndStop
+		if newCursor == self.cursor and self._scraper._count_tweets(obj) == 0:
+			# Twitter sometimes returns the same cursor as requested and no results even though there are more results.
+			# When this happens, retry the same cursor up to the retries setting.
+			self.emptyResponsesOnCursor += 1
+			if self.emptyResponsesOnCursor > self._scraper._retries:
+				self.done = True
+				return
+		if not newCursor or (self.stopOnEmptyResponse and self._scraper._count_tweets(obj) == 0):
+			# End of pagination
+			if promptCursor is not None:
+				newCursor = promptCursor
+			elif self._direction is ScrollDirection.BOTH and self.bottomCursorAndStop is not None:
+				self.dir = 'bottom'
+				newCursor, self.stopOnEmptyResponse = self.bottomCursorAndStop
+				self.bottomCursorAndStop = None
+			else:
+				self.done = True
+				return
+		if newCursor != self.cursor:
+			self.emptyResponsesOnCursor = 0
+		self.cursor = newCursor
+		self.reqParams = self._paginationParams.copy()
+		self.reqParams['cursor'] = self.cursor
+
+
 class TwitterAPIScraper(yats.base.Scraper):
-	def __init__(self, baseUrl, **kwargs):
+	def __init__(self, baseUrl, guestTokenPool = None, rateLimiter = None, stateFile = None, responseCache = None, tweetFactory = None, **kwargs):
 		super().__init__(**kwargs)
 		self._baseUrl = baseUrl
+		self._responseCache = responseCache # a yats.cache.ResponseCache to record API responses to and replay them from
+		if stateFile is not None and not isinstance(stateFile, yats.checkpoint.StateFile):
+			stateFile = yats.checkpoint.StateFile(stateFile)
+		self._stateFile = stateFile # pagination state is saved here, if given, and resumed from automatically
+		self._tweetFactory = tweetFactory # callable(tweet, obj) turning API tweets into items instead of _tweet_to_tweet, e.g. a yats.raw.RawTweetSerializer
+		self._pageUsers = (None, {}) # (page, user_id_str -> User) of the page being converted
 		self._guestToken = None
+		self._guestTokenPool = guestTokenPool if guestTokenPool is not None else yats.tokens.default_pool()
+		self._rateLimiter = rateLimiter if rateLimiter is not None else yats.ratelimit.default_limiter()
 		self._userAgent = f'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/79.0.3945.{random.randint(0, 9999)} Safari/537.{random.randint(0, 99)}'
 		self._apiHeaders = {
 			'User-Agent': self._userAgent,
@@ -185,19 +304,40 @@ class TwitterAPIScraper(yats.base.Scraper):
 	def _ensure_guest_token(self, url = None):
 		if self._guestToken is not None:
 			return
+		self._set_guest_token(self._guestTokenPool.get(lambda: self._fetch_guest_token(url)))
+
+	async def _aensure_guest_token(self, url = None):
+		if self._guestToken is not None:
+			return
+		self._set_guest_token(await self._guestTokenPool.aget(lambda: self._afetch_guest_token(url)))
+
+	def _fetch_guest_token(self, url = None):
 		logger.info('Retrieving guest token')
 		r = self._get(self._baseUrl if url is None else url, headers = {'User-Agent': self._userAgent})
+		return self._guest_token_from_response(r)
+
+	async def _afetch_guest_token(self, url = None):
+		logger.info('Retrieving guest token')
+		r = await self._aget(self._baseUrl if url is None else url, headers = {'User-Agent': self._userAgent})
+		return self._guest_token_from_response(r)
+
+	def _guest_token_from_response(self, r):
+		guestToken = None
 		if (match := re.search(r'document\.cookie = decodeURIComponent\("gt=(\d+); Max-Age=10800; Domain=\.twitter\.com; Path=/; Secure"\);', r.text)):
 			logger.debug('Found guest token in HTML')
-			self._guestToken = match.group(1)
+			guestToken = match.group(1)
 		if 'gt' in r.cookies:
 			logger.debug('Found guest token in cookies')
-			self._guestToken = r.cookies['gt']
-		if self._guestToken:
-			self._session.cookies.set('gt', self._guestToken, domain = '.twitter.com', path = '/', secure = True, expires = time.time() + 10800)
-			self._apiHeaders['x-guest-token'] = self._guestToken
-			return
-		raise yats.base.ScraperException('Unable to find guest token')
+			guestToken = r.cookies['gt']
+		if not guestToken:
+			raise yats.base.ScraperException('Unable to find guest token')
+		return guestToken
+
+	def _set_guest_token(self, guestToken):
+		self._guestToken = guestToken
+		expires = self._guestTokenPool.expiry(guestToken) or time.time() + yats.tokens.GUEST_TOKEN_TTL
+		self._session.cookies.set('gt', self._guestToken, domain = '.twitter.com', path = '/', secure = True, expires = expires)
+		self._apiHeaders['x-guest-token'] = self._guestToken
 
 	def _unset_guest_token(self):
 		self._guestToken = None
@@ -205,10 +345,34 @@ class TwitterAPIScraper(yats.base.Scraper):
 		del self._apiHeaders['x-guest-token']
 
 	def _check_api_response(self, r):
+		self._rateLimiter.update(r.url, self._guestToken, r.headers)
 		if r.status_code in (403, 429):
+			# The token is dropped from the shared pool; whichever scraper asks for a token first fetches the replacement.
+			self._guestTokenPool.invalidate(self._guestToken)
 			self._unset_guest_token()
 			self._ensure_guest_token()
 			return False, f'blocked ({r.status_code})'
+		return self._check_api_response_content(r)
+
+	async def _acheck_api_response(self, r):
+		self._rateLimiter.update(r.url, self._guestToken, r.headers)
+		if r.status_code in (403, 429):
+			self._guestTokenPool.invalidate(self._guestToken)
+			self._unset_guest_token()
+			await self._aensure_guest_token()
+			return False, f'blocked ({r.status_code})'
+		return self._check_api_response_content(r)
+
+	def _retry_delay(self, attempt, r):
+		backoff = super()._retry_delay(attempt, r)
+		if r is not None and r.status_code == 429:
+			# _check_api_response has already swapped the exhausted guest token, so wait for the budget of the new one too;
+			# a fresh token has no known budget yet, the backoff then keeps repeated 429s from being retried immediately.
+			# The retry is one of the requests the limiter keeps in reserve, so no paced slot is taken.
+			return max(self._rateLimiter.peek(r.url, self._guestToken), backoff)
+		return backoff
+
+	def _check_api_response_content(self, r):
 		if r.headers.get('content-type', '').replace(' ', '') != 'application/json;charset=utf-8':
 			return False, 'content type is not JSON'
 		if r.status_code != 200:
@@ -216,83 +380,114 @@ class TwitterAPIScraper(yats.base.Scraper):
 		return True, None
 
 	def _get_api_data(self, endpoint, params):
+		if self._responseCache is not None and (obj := self._responseCache.get(endpoint, params)) is not None:
+			return obj
 		self._ensure_guest_token()
+		self._rateLimiter.wait(endpoint, self._guestToken)
 		r = self._get(endpoint, params = params, headers = self._apiHeaders, responseOkCallback = self._check_api_response)
 		try:
 			obj = r.json()
 		except json.JSONDecodeError as e:
 			raise yats.base.ScraperException('Received invalid JSON from Twitter') from e
+		if self._responseCache is not None:
+			self._responseCache.put(endpoint, params, obj)
 		return obj
 
-	def _iter_api_data(self, endpoint, params, paginationParams = None, cursor = None, direction = ScrollDirection.BOTTOM):
+	async def _in_executor(self, func, *args):
+		# the response cache, state file and seen index do blocking disk/sqlite work, which the asyncio variants run off the event loop.
+		return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+	async def _aget_api_data(self, endpoint, params):
+		if self._responseCache is not None and (obj := await self._in_executor(self._responseCache.get, endpoint, params)) is not None:
+			return obj
+		await self._aensure_guest_token()
+		await self._rateLimiter.await_slot(endpoint, self._guestToken)
+		r = await self._aget(endpoint, params = params, headers = self._apiHeaders, responseOkCallback = self._acheck_api_response)
+		try:
+			obj = r.json()
+		except json.JSONDecodeError as e:
+			raise yats.base.ScraperException('Received invalid JSON from Twitter') from e
+		if self._responseCache is not None:
+			await self._in_executor(self._responseCache.put, endpoint, params, obj)
+		return obj
+
+	def _iter_api_data(self, endpoint, params, paginationParams = None, cursor = None, direction = ScrollDirection.BOTTOM, pagination = None, onPage = None):
 		# Iterate over endpoint with params/paginationParams, optionally starting from a cursor
 		# Handles guest token extraction using the baseUrl passed to __init__ etc.
 		# Order from params and paginationParams is preserved. To insert the cursor at a particular location, insert a 'cursor' key into paginationParams there (value is overwritten).
 		# direction controls in which direction it should scroll from the initial response. BOTH equals TOP followed by BOTTOM.
-
-		# Logic for dual scrolling: direction is set to top, but if the bottom cursor is found, bottomCursorAndStop is set accordingly.
-		# Once the top pagination is exhausted, the bottomCursorAndStop is used and reset to None; it isn't set anymore after because the first entry condition will always be true for the bottom cursor.
-
-		if cursor is None:
-			reqParams = params
-		else:
-			reqParams = paginationParams.copy()
-			reqParams['cursor'] = cursor
-		bottomCursorAndStop = None
-		if direction is ScrollDirection.TOP or direction is ScrollDirection.BOTH:
-			dir = 'top'
-		else:
-			dir = 'bottom'
-		stopOnEmptyResponse = False
-		emptyResponsesOnCursor = 0
-		while True:
-			logger.info(f'Retrieving scroll page {cursor}')
-			obj = self._get_api_data(endpoint, reqParams)
+		# The cursor logic lives in _Pagination so that _aiter_api_data scrolls exactly the same way.
+		# A (restored) _Pagination can be passed instead of cursor/direction; onPage is called with it once a page has been consumed.
+		if pagination is None:
+			pagination = _Pagination(self, params, paginationParams, cursor, direction)
+		while not pagination.done:
+			logger.info(f'Retrieving scroll page {pagination.cursor}')
+			obj = self._get_api_data(endpoint, pagination.reqParams)
 			yield obj
+			pagination.advance(obj)
+			if onPage is not None:
+				onPage(pagination)
+
+	async def _aiter_api_data(self, endpoint, params, paginationParams = None, cursor = None, direction = ScrollDirection.BOTTOM, pagination = None, onPage = None):
+		# asyncio counterpart of _iter_api_data
+		if pagination is None:
+			pagination = _Pagination(self, params, paginationParams, cursor, direction)
+		while not pagination.done:
+			logger.info(f'Retrieving scroll page {pagination.cursor}')
+			obj = await self._aget_api_data(endpoint, pagination.reqParams)
+			yield obj
+			pagination.advance(obj)
+			if onPage is not None:
+				await self._in_executor(onPage, pagination)
 
-			# No data format test, just a hard and loud crash if anything's wrong :-)
-			newCursor = None
-			promptCursor = None
-			newBottomCursorAndStop = None
-			for instruction in obj['timeline']['instructions']:
-				if 'addEntries' in instruction:
-					entries = instruction['addEntries']['entries']
-				elif 'replaceEntry' in instruction:
-					entries = [instruction['replaceEntry']['entry']]
-				else:
-					continue
-				for entry in entries:
-					if entry['entryId'] == f'sq-cursor-{dir}' or entry['entryId'].startswith(f'cursor-{dir}-'):
-						newCursor = entry['content']['operation']['cursor']['value']
-						if 'stopOnEmptyResponse' in entry['content']['operation']['cursor']:
-							stopOnEmptyResponse = entry['content']['operation']['cursor']['stopOnEmptyResponse']
-					elif entry['entryId'].startswith('cursor-showMoreThreadsPrompt-'): # E.g. 'offensive' replies button
-						promptCursor = entry['content']['operation']['cursor']['value']
-					elif direction is ScrollDirection.BOTH and bottomCursorAndStop is None and (entry['entryId'] == f'sq-cursor-bottom' or entry['entryId'].startswith('cursor-bottom-')):
-						newBottomCursorAndStop = (entry['content']['operation']['cursor']['value'], entry['content']['operation']['cursor'].get('stopOnEmptyResponse', False))
-			if bottomCursorAndStop is None and newBottomCursorAndStop is not None:
-				bottomCursorAndStop = newBottomCursorAndStop
-			if newCursor == cursor and self._count_tweets(obj) == 0:
-				# Twitter sometimes returns the same cursor as requested and no results even though there are more results.
-				# When this happens, retry the same cursor up to the retries setting.
-				emptyResponsesOnCursor += 1
-				if emptyResponsesOnCursor > self._retries:
-					break
-			if not newCursor or (stopOnEmptyResponse and self._count_tweets(obj) == 0):
-				# End of pagination
-				if promptCursor is not None:
-					newCursor = promptCursor
-				elif direction is ScrollDirection.BOTH and bottomCursorAndStop is not None:
-					dir = 'bottom'
-					newCursor, stopOnEmptyResponse = bottomCursorAndStop
-					bottomCursorAndStop = None
-				else:
-					break
-			if newCursor != cursor:
-				emptyResponsesOnCursor = 0
-			cursor = newCursor
-			reqParams = paginationParams.copy()
-			reqParams['cursor'] = cursor
+	def _state_key(self):
+		'''Identifies the crawl a saved state belongs to; a state file written for a different crawl is ignored.'''
+		return {'scraper': self.name}
+
+	def _load_state(self):
+		if self._stateFile is None:
+			return None
+		state = self._stateFile.load()
+		if state is None:
+			return None
+		if state.get('key') != self._state_key():
+			logger.warning(f'Ignoring state file {self._stateFile.path} of a different crawl: {state.get("key")!r}')
+			return None
+		logger.info(f'Resuming from state file {self._stateFile.path}')
+		return state
+
+	def _checkpoint_state(self, getState):
+		if self._stateFile is not None:
+			self._stateFile.tick(lambda: {'key': self._state_key(), **getState()})
+
+	def _clear_state(self):
+		if self._stateFile is not None:
+			self._stateFile.remove()
+
+	def clear_state(self):
+		'''Forget the saved state of a crawl the caller stopped early on purpose (e.g. at a result limit), so that the next crawl starts afresh.'''
+		self._clear_state()
+
+	def _resumable_pagination(self, params, paginationParams, cursor = None, direction = ScrollDirection.BOTTOM):
+		'''A _Pagination continuing from the state file if there is one, the onPage callback that keeps the state file up to date,
+		and the list of the items handed out so far (None without a state file). The items are saved next to the state (see
+		StateFile.append_items): when resuming, the list holds the items handed out before the interruption, which have to be
+		handed out again first; every item handed out has to be appended to it.'''
+		pagination = _Pagination(self, params, paginationParams, cursor, direction)
+		if self._stateFile is None:
+			return pagination, None, None
+		delivered = []
+		if (state := self._load_state()) is not None:
+			pagination.restore(state['pagination'])
+			# states saved before the items were kept have nothing to hand out again.
+			delivered = self._stateFile.load_items(state.get('delivered', 0))
+		saved = [len(delivered)]
+		def getState():
+			# the items go first: a crash in between leaves extra items that the state doesn't count, they are dropped on load.
+			self._stateFile.append_items(delivered[saved[0]:])
+			saved[0] = len(delivered)
+			return {'pagination': pagination.state(), 'delivered': len(delivered)}
+		return pagination, lambda pagination: self._checkpoint_state(getState), delivered
 
 	def _count_tweets(self, obj):
 		count = 0
@@ -342,7 +537,12 @@ class TwitterAPIScraper(yats.base.Scraper):
 			tweet = obj['globalObjects']['tweets'][entry['item']['content']['tombstone']['tweet']['id']]
 		else:
 			raise yats.base.ScraperException(f'Unable to handle entry {entryId!r}')
-		yield self._tweet_to_tweet(tweet, obj)
+		yield self._make_tweet(tweet, obj)
+
+	def _make_tweet(self, tweet, obj):
+		if self._tweetFactory is not None:
+			return self._tweetFactory(tweet, obj)
+		return self._tweet_to_tweet(tweet, obj)
 
 	def _tweet_to_tweet(self, tweet, obj):
 		# Transforms a Twitter API tweet object into a Tweet
@@ -350,8 +550,8 @@ class TwitterAPIScraper(yats.base.Scraper):
 		kwargs['id'] = tweet['id'] if 'id' in tweet else int(tweet['id_str'])
 		kwargs['content'] = tweet['full_text']
 		kwargs['renderedContent'] = self._render_text_with_urls(tweet['full_text'], tweet['entities'].get('urls'))
-		kwargs['user'] = self._user_to_user(obj['globalObjects']['users'][tweet['user_id_str']])
-		kwargs['date'] = email.utils.parsedate_to_datetime(tweet['created_at'])
+		kwargs['user'] = self._page_user(tweet['user_id_str'], obj)
+		kwargs['date'] = yats.utils.parse_created_at(tweet['created_at'])
 		if tweet['entities'].get('urls'):
 			kwargs['outlinks'] = [u['expanded_url'] for u in tweet['entities']['urls']]
 			kwargs['tcooutlinks'] = [u['url'] for u in tweet['entities']['urls']]
@@ -451,6 +651,16 @@ class TwitterAPIScraper(yats.base.Scraper):
 			out.append(text[url['indices'][1] : nextUrl['indices'][0] if nextUrl is not None else None])
 		return ''.join(out)
 
+	def _page_user(self, userIdStr, obj):
+		'''The User of a globalObjects user; it is built once per page and shared by all tweets of that author.'''
+		page, users = self._pageUsers
+		if page is not obj:
+			users = {}
+			self._pageUsers = (obj, users)
+		if userIdStr not in users:
+			users[userIdStr] = self._user_to_user(obj['globalObjects']['users'][userIdStr])
+		return users[userIdStr]
+
 	def _user_to_user(self, user):
 		kwargs = {}
 		kwargs['username'] = user['screen_name']
@@ -461,7 +671,7 @@ class TwitterAPIScraper(yats.base.Scraper):
 		if user['entities']['description'].get('urls'):
 			kwargs['descriptionUrls'] = [{'text': x.get('display_url'), 'url': x['expanded_url'], 'tcourl': x['url'], 'indices': tuple(x['indices'])} for x in user['entities']['description']['urls']]
 		kwargs['verified'] = user.get('verified')
-		kwargs['created'] = email.utils.parsedate_to_datetime(user['created_at'])
+		kwargs['created'] = yats.utils.cached_parse_created_at(user['created_at'])
 		kwargs['followersCount'] = user['followers_count']
 		kwargs['friendsCount'] = user['friends_count']
 		kwargs['statusesCount'] = user['statuses_count']
@@ -510,7 +720,7 @@ class TwitterSearchScraper(TwitterAPIScraper):
 			return False, f'non-200 status code'
 		return True, None
 
-	def get_items(self):
+	def _search_params(self):
 		paginationParams = {
 			'include_profile_interstitial_type': '1',
 			'include_blocking': '1',
@@ -548,9 +758,35 @@ class TwitterSearchScraper(TwitterAPIScraper):
 		if self._top:
 			del params['tweet_search_mode']
 			del paginationParams['tweet_search_mode']
+		return params, paginationParams
 
-		for obj in self._iter_api_data('https://api.twitter.com/2/search/adaptive.json', params, paginationParams, cursor = self._cursor):
-			yield from self._instructions_to_tweets(obj)
+	def _state_key(self):
+		return {'scraper': self.name, 'query': self._query, 'top': self._top}
+
+	def get_items(self):
+		params, paginationParams = self._search_params()
+		pagination, onPage, delivered = self._resumable_pagination(params, paginationParams, cursor = self._cursor)
+		for tweet in list(delivered or ()):
+			yield tweet # handed out before the crawl was interrupted
+		for obj in self._iter_api_data('https://api.twitter.com/2/search/adaptive.json', params, paginationParams, pagination = pagination, onPage = onPage):
+			for tweet in self._instructions_to_tweets(obj):
+				if delivered is not None:
+					delivered.append(tweet)
+				yield tweet
+		self._clear_state()
+
+	async def aget_items(self):
+		'''asyncio variant of get_items, for use with `async for`.'''
+		params, paginationParams = self._search_params()
+		pagination, onPage, delivered = await self._in_executor(lambda: self._resumable_pagination(params, paginationParams, cursor = self._cursor))
+		for tweet in list(delivered or ()):
+			yield tweet # handed out before the crawl was interrupted
+		async for obj in self._aiter_api_data('https://api.twitter.com/2/search/adaptive.json', params, paginationParams, pagination = pagination, onPage = onPage):
+			for tweet in self._instructions_to_tweets(obj):
+				if delivered is not None:
+					delivered.append(tweet)
+				yield tweet
+		await self._in_executor(self._clear_state)
 
 	@classmethod
 	def setup_parser(cls, subparser):
@@ -624,6 +860,16 @@ class TwitterUserScraper(TwitterSearchScraper):
 			self._query = f'from:{self._username}'
 		yield from super().get_items()
 
+	async def aget_items(self):
+		if self._isUserId:
+			# Resolve user ID to username; the entity lookup is blocking, so keep it off the event loop
+			entity = await asyncio.get_running_loop().run_in_executor(None, lambda: self.entity)
+			self._username = entity.username
+			self._isUserId = False
+			self._query = f'from:{self._username}'
+		async for tweet in super().aget_items():
+			yield tweet
+
 	@staticmethod
 	def is_valid_username(s):
 		return (1 <= len(s) <= 15 and s.strip(string.ascii_letters + string.digits + '_') == '') or (s and s.strip(string.digits) == '')
@@ -646,11 +892,7 @@ class TwitterUserScraper(TwitterSearchScraper):
 class TwitterProfileScraper(TwitterUserScraper):
 	name = 'twitter-profile'
 
-	def get_items(self):
-		if not self._isUserId:
-			userId = self.entity.id
-		else:
-			userId = self._username
+	def _profile_params(self, userId):
 		paginationParams = {
 			'include_profile_interstitial_type': '1',
 			'include_blocking': '1',
@@ -681,10 +923,28 @@ class TwitterProfileScraper(TwitterUserScraper):
 		}
 		params = paginationParams.copy()
 		del params['cursor']
+		return params, paginationParams
 
+	def get_items(self):
+		if not self._isUserId:
+			userId = self.entity.id
+		else:
+			userId = self._username
+		params, paginationParams = self._profile_params(userId)
 		for obj in self._iter_api_data(f'https://api.twitter.com/2/timeline/profile/{userId}.json', params, paginationParams):
 			yield from self._instructions_to_tweets(obj)
 
+	async def aget_items(self):
+		if not self._isUserId:
+			# The entity lookup is blocking, so keep it off the event loop
+			userId = (await asyncio.get_running_loop().run_in_executor(None, lambda: self.entity)).id
+		else:
+			userId = self._username
+		params, paginationParams = self._profile_params(userId)
+		async for obj in self._aiter_api_data(f'https://api.twitter.com/2/timeline/profile/{userId}.json', params, paginationParams):
+			for tweet in self._instructions_to_tweets(obj):
+				yield tweet
+
 
 class TwitterHashtagScraper(TwitterSearchScraper):
 	name = 'twitter-hashtag'
@@ -716,15 +976,167 @@ class TwitterTweetScraperMode(enum.Enum):
 		return cls.SINGLE
 
 
+class _Recursion:
+	'''Work queue of TwitterTweetScraperMode.RECURSE: the tweets whose conversations still have to be scrolled and the tweets seen so far.
+
+	With prune, it also keeps the reported reply count and the parent of every seen tweet and counts the distinct direct replies seen per tweet.
+	A tweet is covered once all its direct replies and its whole ancestor chain have been seen: its children with replies are queued themselves,
+	so scrolling its conversation can't turn up anything new. Covered tweets aren't expanded (skippedExpansions) and the scroll of the current tweet
+	stops as soon as it is covered (cutPaginations). Each of these saves at least one request.
+
+	With a state file, the tweets handed out so far are kept (delivered) and saved next to the state, so that a resumed crawl hands them
+	out again before continuing: seenTweets keeps them from being yielded a second time, the caller has to get them from somewhere.
+
+	With a yats.seen.SeenIndex, tweets of conversations stored by earlier runs aren't yielded again (they are still tracked and queued) and aren't
+	expanded again (knownExpansions): the recursion continues from their replies known to the index. The index is only read here, it is written
+	once the caller has stored the conversation (see SNScrapeWrapper.remember).'''
+
+	def __init__(self, tweetId, prune = True, seenIndex = None):
+		self.queue = collections.deque([tweetId])
+		self.seenTweets = set()
+		self.current = None # tweet whose conversation is being scrolled
+		self.paginationState = None # saved pagination of current, when resuming
+		self.prune = prune
+		self.replyCounts = {} # tweet id -> reported reply count
+		self.parents = {} # tweet id -> id of the tweet it replies to, or None
+		self.repliesSeen = {} # tweet id -> number of its direct replies seen
+		self._rooted = set() # tweets whose ancestors have all been seen
+		self.seenIndex = seenIndex
+		self.skippedExpansions = 0
+		self.cutPaginations = 0
+		self.knownExpansions = 0
+		self.delivered = None # tweets handed out so far, when they have to be saved with the state
+		self.savedDelivered = 0 # how many of them were saved already
+
+	@property
+	def savedRequests(self):
+		'''Lower bound of the requests saved by pruning and the seen index.'''
+		return self.skippedExpansions + self.cutPaginations + self.knownExpansions
+
+	@staticmethod
+	def _fields(tweet):
+		'''(id, id of the tweet it replies to, reply count) of a Tweet or a serialized tweet (see tweetFactory).'''
+		if isinstance(tweet, dict):
+			return tweet['id'], tweet['in_reply_to_tweet_id'], tweet['reply_count']
+		return tweet.id, tweet.inReplyToTweetId, tweet.replyCount
+
+	def see(self, tweet, known = None):
+		'''Returns whether the tweet is new; new tweets with replies are queued for expansion. The tweet can be a Tweet or a serialized tweet (see tweetFactory).
+		known, if given, is the result of known() for a batch containing the tweet, which then spares the seen index lookup.'''
+		tweetId, parentId, replyCount = self._fields(tweet)
+		if not self._add(tweetId, parentId, replyCount):
+			return False
+		if known is not None:
+			return int(tweetId) not in known
+		if self.seenIndex is not None and self.seenIndex.has_tweet(tweetId):
+			return False
+		return True
+
+	def known(self, tweets):
+		'''The ids of the tweets that the seen index knows, for see.'''
+		if self.seenIndex is None:
+			return set()
+		return self.seenIndex.known_tweets(self._fields(tweet)[0] for tweet in tweets)
+
+	def _add(self, tweetId, parentId, replyCount):
+		if tweetId in self.seenTweets:
+			return False
+		self.seenTweets.add(tweetId)
+		if self.prune:
+			self._track(tweetId, replyCount, parentId)
+		if replyCount:
+			self.queue.append(tweetId)
+		return True
+
+	def _track(self, tweetId, replyCount, parentId):
+		self.replyCounts[tweetId] = replyCount
+		self.parents[tweetId] = parentId
+		if parentId is not None:
+			self.repliesSeen[parentId] = self.repliesSeen.get(parentId, 0) + 1
+
+	def _ancestors_seen(self, tweetId):
+		path = []
+		while tweetId not in self._rooted:
+			if tweetId not in self.parents:
+				return False
+			path.append(tweetId)
+			tweetId = self.parents[tweetId]
+			if tweetId is None:
+				break
+		self._rooted.update(path)
+		return True
+
+	def covered(self, tweetId):
+		'''Whether scrolling the conversation of tweetId can be skipped.'''
+		if not self.prune or tweetId is None:
+			return False
+		tweetId = int(tweetId)
+		if tweetId not in self.replyCounts or self.repliesSeen.get(tweetId, 0) < self.replyCounts[tweetId]:
+			return False
+		return self._ancestors_seen(tweetId)
+
+	def next(self):
+		'''Make the next tweet that isn't covered yet current; returns False once the queue is exhausted.'''
+		while self.queue:
+			tweetId = self.queue.popleft()
+			if self.covered(tweetId):
+				self.skippedExpansions += 1
+				continue
+			if self.seenIndex is not None and self.seenIndex.has_tweet(tweetId):
+				self.knownExpansions += 1
+				for replyId, parentId, replyCount in self.seenIndex.replies(tweetId):
+					self._add(replyId, parentId, replyCount)
+				continue
+			self.current = tweetId
+			return True
+		return False
+
+	def state(self, pagination):
+		return {
+			'queue': list(self.queue),
+			'seenTweets': list(self.seenTweets),
+			'current': self.current,
+			'pagination': pagination.state(),
+			'tweets': [[tweetId, replyCount, self.parents[tweetId]] for tweetId, replyCount in self.replyCounts.items()],
+			'skippedExpansions': self.skippedExpansions,
+			'cutPaginations': self.cutPaginations,
+			'knownExpansions': self.knownExpansions,
+			'delivered': len(self.delivered) if self.delivered is not None else 0,
+		}
+
+	def restore(self, state):
+		self.queue = collections.deque(state['queue'])
+		self.seenTweets = set(state['seenTweets'])
+		self.current = state['current']
+		self.paginationState = state['pagination']
+		# states saved before pruning lack these; their tweets then simply never count as covered.
+		if self.prune:
+			for tweetId, replyCount, parentId in state.get('tweets', []):
+				self._track(tweetId, replyCount, parentId)
+		self.skippedExpansions = state.get('skippedExpansions', 0)
+		self.cutPaginations = state.get('cutPaginations', 0)
+		self.knownExpansions = state.get('knownExpansions', 0)
+
+
 class TwitterTweetScraper(TwitterAPIScraper):
 	name = 'twitter-tweet'
 
-	def __init__(self, tweetId, mode, **kwargs):
+	def __init__(self, tweetId, mode, pruneRecursion = True, seenIndex = None, **kwargs):
 		self._tweetId = tweetId
 		self._mode = mode
+		self._pruneRecursion = pruneRecursion # RECURSE: don't scroll conversations whose replies have all been seen, see _Recursion
+		if seenIndex is not None and not isinstance(seenIndex, yats.seen.SeenIndex):
+			seenIndex = yats.seen.SeenIndex(seenIndex)
+		self._seenIndex = seenIndex # RECURSE: tweets of conversations stored by earlier runs are skipped, if given
+		self._recursionState = None # the _Recursion of the last RECURSE run, for savedRequests
 		super().__init__(f'https://twitter.com/i/web/{self._tweetId}', **kwargs)
 
-	def get_items(self):
+	@property
+	def savedRequests(self):
+		'''Lower bound of the requests the last RECURSE run saved by pruning covered tweets.'''
+		return self._recursionState.savedRequests if self._recursionState is not None else 0
+
+	def _conversation_params(self):
 		paginationParams = {
 			'include_profile_interstitial_type': '1',
 			'include_blocking': '1',
@@ -754,25 +1166,115 @@ class TwitterTweetScraper(TwitterAPIScraper):
 		}
 		params = paginationParams.copy()
 		del params['cursor']
+		return params, paginationParams
+
+	def _state_key(self):
+		return {'scraper': self.name, 'tweetId': str(self._tweetId), 'mode': self._mode.value}
+
+	def _recursion(self):
+		recursion = _Recursion(self._tweetId, prune = self._pruneRecursion, seenIndex = self._seenIndex)
+		if self._stateFile is not None:
+			recursion.delivered = []
+			if (state := self._load_state()) is not None:
+				recursion.restore(state['recursion'])
+				# states saved before the tweets were kept have nothing to hand out again.
+				recursion.delivered = self._stateFile.load_items(state['recursion'].get('delivered', 0))
+				recursion.savedDelivered = len(recursion.delivered)
+		self._recursionState = recursion
+		return recursion
+
+	def _recursion_state(self, recursion, pagination):
+		# the tweets go first: a crash in between leaves extra tweets that the state doesn't count, they are dropped on load.
+		self._stateFile.append_items(recursion.delivered[recursion.savedDelivered:])
+		recursion.savedDelivered = len(recursion.delivered)
+		return {'recursion': recursion.state(pagination)}
+
+	def _next_recursion_pagination(self, recursion, params, paginationParams):
+		'''Pick the next tweet to expand (or continue the one in progress when resuming); returns its pagination and onPage callback, or (None, None) once there is nothing left to expand.'''
+		pagination = _Pagination(self, params, paginationParams, None, ScrollDirection.BOTH)
+		if recursion.paginationState is not None:
+			pagination.restore(recursion.paginationState)
+			recursion.paginationState = None
+		elif not recursion.next():
+			return None, None
+		def onPage(pagination):
+			if not pagination.done and recursion.covered(recursion.current):
+				pagination.done = True
+				recursion.cutPaginations += 1
+			self._checkpoint_state(lambda: self._recursion_state(recursion, pagination))
+		return pagination, onPage
+
+	def _log_recursion(self, recursion):
+		if recursion.prune:
+			logger.info(f'Pruning saved at least {recursion.savedRequests} requests ({recursion.skippedExpansions} expansions skipped, {recursion.cutPaginations} scrolls cut short, {recursion.knownExpansions} expanded by earlier runs)')
+
+	def get_items(self):
+		params, paginationParams = self._conversation_params()
 		if self._mode is TwitterTweetScraperMode.SINGLE:
 			obj = self._get_api_data(f'https://twitter.com/i/api/2/timeline/conversation/{self._tweetId}.json', params)
-			yield self._tweet_to_tweet(obj['globalObjects']['tweets'][str(self._tweetId)], obj)
+			yield self._make_tweet(obj['globalObjects']['tweets'][str(self._tweetId)], obj)
 		elif self._mode is TwitterTweetScraperMode.SCROLL:
-			for obj in self._iter_api_data(f'https://twitter.com/i/api/2/timeline/conversation/{self._tweetId}.json', params, paginationParams, direction = ScrollDirection.BOTH):
-				yield from self._instructions_to_tweets(obj, includeConversationThreads = True)
+			pagination, onPage, delivered = self._resumable_pagination(params, paginationParams, direction = ScrollDirection.BOTH)
+			for tweet in list(delivered or ()):
+				yield tweet # handed out before the crawl was interrupted
+			for obj in self._iter_api_data(f'https://twitter.com/i/api/2/timeline/conversation/{self._tweetId}.json', params, paginationParams, pagination = pagination, onPage = onPage):
+				for tweet in self._instructions_to_tweets(obj, includeConversationThreads = True):
+					if delivered is not None:
+						delivered.append(tweet)
+					yield tweet
+			self._clear_state()
 		elif self._mode is TwitterTweetScraperMode.RECURSE:
-			seenTweets = set()
-			queue = collections.deque()
-			queue.append(self._tweetId)
-			while queue:
-				tweetId = queue.popleft()
-				for obj in self._iter_api_data(f'https://twitter.com/i/api/2/timeline/conversation/{tweetId}.json', params, paginationParams, direction = ScrollDirection.BOTH):
+			recursion = self._recursion()
+			for tweet in list(recursion.delivered or ()):
+				yield tweet # handed out before the crawl was interrupted
+			while True:
+				pagination, onPage = self._next_recursion_pagination(recursion, params, paginationParams)
+				if pagination is None:
+					break
+				for obj in self._iter_api_data(f'https://twitter.com/i/api/2/timeline/conversation/{recursion.current}.json', params, paginationParams, pagination = pagination, onPage = onPage):
 					for tweet in self._instructions_to_tweets(obj, includeConversationThreads = True):
-						if tweet.id not in seenTweets:
+						if recursion.see(tweet):
+							if recursion.delivered is not None:
+								recursion.delivered.append(tweet)
+							yield tweet
+			self._log_recursion(recursion)
+			self._clear_state()
+
+	async def aget_items(self):
+		'''asyncio variant of get_items, for use with `async for`.'''
+		params, paginationParams = self._conversation_params()
+		if self._mode is TwitterTweetScraperMode.SINGLE:
+			obj = await self._aget_api_data(f'https://twitter.com/i/api/2/timeline/conversation/{self._tweetId}.json', params)
+			yield self._make_tweet(obj['globalObjects']['tweets'][str(self._tweetId)], obj)
+		elif self._mode is TwitterTweetScraperMode.SCROLL:
+			pagination, onPage, delivered = await self._in_executor(lambda: self._resumable_pagination(params, paginationParams, direction = ScrollDirection.BOTH))
+			for tweet in list(delivered or ()):
+				yield tweet # handed out before the crawl was interrupted
+			async for obj in self._aiter_api_data(f'https://twitter.com/i/api/2/timeline/conversation/{self._tweetId}.json', params, paginationParams, pagination = pagination, onPage = onPage):
+				for tweet in self._instructions_to_tweets(obj, includeConversationThreads = True):
+					if delivered is not None:
+						delivered.append(tweet)
+					yield tweet
+			await self._in_executor(self._clear_state)
+		elif self._mode is TwitterTweetScraperMode.RECURSE:
+			recursion = await self._in_executor(self._recursion)
+			for tweet in list(recursion.delivered or ()):
+				yield tweet # handed out before the crawl was interrupted
+			while True:
+				pagination, onPage = await self._in_executor(self._next_recursion_pagination, recursion, params, paginationParams)
+				if pagination is None:
+					break
+				async for obj in self._aiter_api_data(f'https://twitter.com/i/api/2/timeline/conversation/{recursion.current}.json', params, paginationParams, pagination = pagination, onPage = onPage):
+					tweets = list(self._instructions_to_tweets(obj, includeConversationThreads = True))
+					# one seen index lookup per page instead of one per tweet.
+					known = await self._in_executor(recursion.known, tweets)
+					for tweet in tweets:
+						if recursion.see(tweet, known = known):
+							if recursion.delivered is not None:
+								recursion.delivered.append(tweet)
 							yield tweet
-							seenTweets.add(tweet.id)
-							if tweet.replyCount:
-								queue.append(tweet.id)
+			self._log_recursion(recursion)
+			await self._in_executor(self._clear_state)
 
 	@classmethod
 	def setup_parser(cls, subparser):
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# sqlite storage of serialized tweets, users and reply edges.
+import os
+import json
+import sqlite3
+import pathlib
+import threading
+from typing import Union, List, Dict, Optional, Iterator, Tuple
+try:
+    from .normalize import Normalizer, denormalize
+except ImportError:
+    from yats.normalize import Normalizer, denormalize
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tweets (
+    id INTEGER PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    conversation_id INTEGER,
+    in_reply_to_tweet_id INTEGER,
+    user_id INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tweets_conversation ON tweets (conversation_id, seq);
+CREATE INDEX IF NOT EXISTS tweets_in_reply_to ON tweets (in_reply_to_tweet_id);
+CREATE INDEX IF NOT EXISTS tweets_user ON tweets (user_id);
+CREATE TABLE IF NOT EXISTS embedded_tweets (
+    id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    username TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS mentioned_users (
+    id INTEGER PRIMARY KEY,
+    username TEXT,
+    data TEXT NOT NULL
+);
+'''
+# sqlite limits the number of host parameters of a statement.
+_BATCH = 500
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False)
+
+
+class SQLiteStore:
+    '''
+    Serialized tweets in an indexed sqlite database, in the normalized form of yats.normalize:
+        tweets: one row per tweet, with its reply edge (conversation_id, in_reply_to_tweet_id) and author as
+            indexed columns and the normalized tweet as json. a tweet stored again (e.g. a re-crawl) is updated
+            in place and keeps its position in the conversation.
+        embedded_tweets: retweeted/quoted tweets.
+        users, mentioned_users: full profiles and partial users (mentions, reply targets); the latest profile wins,
+            within a batch as well as across batches. only one profile per user is kept, so a conversation in which
+            a user shows up with several snapshots (e.g. follower counts that changed while scraping) comes back
+            with the latest one everywhere: like normalize.denormalize, reading is lossy for user snapshots.
+    Tweets added one by one are buffered and written `batch_size` at a time, each batch in one transaction. Queries flush first.
+    `write(conversation_id, conversation)` makes it a drop in replacement for checkpoint.ConversationWriter: like a
+    checkpoint line, a written conversation is committed before write returns.
+    '''
+    def __init__(self, path: Union[str, pathlib.Path], batch_size: int=1000):
+        self.path = path
+        self.batch_size = batch_size
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._seq = self._db.execute("SELECT COALESCE(MAX(seq), -1) + 1 FROM tweets").fetchone()[0]
+        self._pending = Normalizer(latest=True)
+
+    def add(self, tweet: dict):
+        '''store a serialized tweet (see TweetSerializer).'''
+        with self._lock:
+            self._pending.add(tweet)
+            if len(self._pending.tweets) >= self.batch_size:
+                self.flush()
+
+    def write(self, conversation_id: Union[str, int], conversation: List[dict]):
+        '''store the tweets of a conversation and commit them, like ConversationWriter.write.'''
+        with self._lock:
+            for tweet in conversation:
+                self.add(tweet)
+            self.flush()
+
+    def flush(self):
+        '''write the buffered tweets in one transaction.'''
+        with self._lock:
+            table = self._pending.table()
+            if not any(table.values()):
+                return
+            tweets = []
+            for row in table["tweets"]:
+                tweets.append((row["id"], self._seq, row.get("conversation_id"), row.get("in_reply_to_tweet_id"), row.get("user_id"), _dumps(row)))
+                self._seq += 1
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany(
+                    "INSERT INTO tweets VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET "
+                    "conversation_id = excluded.conversation_id, in_reply_to_tweet_id = excluded.in_reply_to_tweet_id, "
+                    "user_id = excluded.user_id, data = excluded.data",
+                    tweets,
+                )
+                self._db.executemany("INSERT OR REPLACE INTO embedded_tweets VALUES (?, ?)", ((row["id"], _dumps(row)) for row in table["embedded_tweets"]))
+                for name in ("users", "mentioned_users"):
+                    self._db.executemany(f"INSERT OR REPLACE INTO {name} VALUES (?, ?, ?)", ((user["id"], user.get("username"), _dumps(user)) for user in table[name]))
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            self._pending = Normalizer(latest=True)
+
+    def _select(self, sql: str, ids: List) -> List[tuple]:
+        rows = []
+        for start in range(0, len(ids), _BATCH):
+            batch = ids[start:start + _BATCH]
+            rows.extend(self._db.execute(sql.format(",".join("?" * len(batch))), batch))
+        return rows
+
+    def _expand(self, rows: List[dict]) -> List[dict]:
+        '''denormalize tweet rows, fetching the users and embedded tweets they refer to.'''
+        embedded, pending = {}, set()
+        def refer(row):
+            for key in ("retweeted_tweet_id", "quoted_tweet_id"):
+                if row.get(key) is not None and row[key] not in embedded:
+                    pending.add(row[key])
+        for row in rows:
+            refer(row)
+        while pending:
+            ids, pending = list(pending), set()
+            for tweet_id, data in self._select("SELECT id, data FROM embedded_tweets WHERE id IN ({})", ids):
+                embedded[tweet_id] = row = json.loads(data)
+                refer(row)
+        user_ids = set()
+        for row in rows + list(embedded.values()):
+            user_ids.update(user_id for user_id in (row.get("user_id"), row.get("in_reply_to_user_id")) if user_id is not None)
+            user_ids.update(row.get("mentioned_user_ids") or ())
+        table = {"tweets": rows, "embedded_tweets": list(embedded.values())}
+        for name in ("users", "mentioned_users"):
+            table[name] = [json.loads(data) for (data,) in self._select(f"SELECT data FROM {name} WHERE id IN ({{}})", list(user_ids))]
+        return denormalize(table)
+
+    def conversation(self, conversation_id: Union[str, int]) -> List[dict]:
+        '''the stored tweets of a conversation, in the order they were first stored; ready for tree.buildTree.'''
+        with self._lock:
+            self.flush()
+            rows = self._db.execute("SELECT data FROM tweets WHERE conversation_id = ? ORDER BY seq", (int(conversation_id),))
+            return self._expand([json.loads(data) for (data,) in rows])
+
+    def tweet(self, tweet_id: Union[str, int]) -> Optional[dict]:
+        with self._lock:
+            self.flush()
+            row = self._db.execute("SELECT data FROM tweets WHERE id = ?", (int(tweet_id),)).fetchone()
+            return self._expand([json.loads(row[0])])[0] if row else None
+
+    def replies(self, tweet_id: Union[str, int]) -> List[int]:
+        '''ids of the stored direct replies of a tweet.'''
+        with self._lock:
+            self.flush()
+            return [tweet_id for (tweet_id,) in self._db.execute("SELECT id FROM tweets WHERE in_reply_to_tweet_id = ? ORDER BY seq", (int(tweet_id),))]
+
+    def user(self, user_id: Union[str, int]) -> Optional[dict]:
+        '''the stored profile of a user, or its partial form if it was only mentioned.'''
+        with self._lock:
+            self.flush()
+            for name in ("users", "mentioned_users"):
+                row = self._db.execute(f"SELECT data FROM {name} WHERE id = ?", (int(user_id),)).fetchone()
+                if row:
+                    return json.loads(row[0])
+            return None
+
+    def conversation_ids(self) -> List[int]:
+        with self._lock:
+            self.flush()
+            return [conversation_id for (conversation_id,) in self._db.execute("SELECT conversation_id FROM tweets GROUP BY conversation_id ORDER BY MIN(seq)")]
+
+    def iter_conversations(self) -> Iterator[Tuple[str, List[dict]]]:
+        '''yield (conversation_id, tweets) pairs like checkpoint.iter_conversations, one conversation at a time.'''
+        for conversation_id in self.conversation_ids():
+            yield str(conversation_id), self.conversation(conversation_id)
+
+    def __len__(self):
+        with self._lock:
+            self.flush()
+            return self._db.execute("SELECT COUNT(*) FROM tweets").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
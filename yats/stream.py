@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# incremental json reading/writing for files that don't fit in memory.
+import json
+from typing import Any, Iterator, Tuple, TextIO
+
+_WHITESPACE = " \t\n\r"
+
+
+class _IncrementalReader:
+    '''a growing window over a text file, consumed from the front.'''
+    def __init__(self, f: TextIO, chunk_size: int):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self) -> bool:
+        '''read more data, at least doubling the unconsumed window so re-parsing stays linear overall.'''
+        if self.eof:
+            return False
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        data = self.f.read(max(self.chunk_size, len(self.buf)))
+        if not data:
+            self.eof = True
+            return False
+        self.buf += data
+        return True
+
+    def peek(self) -> str:
+        '''next non-whitespace character, '' at the end of the file.'''
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"expected {char!r} at offset {self.pos} of the current window, found {self.peek()!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        '''decode the next json value.'''
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # a number at the end of the window might continue in the next chunk.
+            if end == len(self.buf) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_object(f: TextIO, chunk_size: int=1<<20) -> Iterator[Tuple[str, Any]]:
+    '''yield the (key, value) pairs of a top level json object one at a time.
+    memory is bounded by the largest value (times two), not by the size of the file.'''
+    reader = _IncrementalReader(f, chunk_size)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        yield key, reader.value()
+        if reader.peek() == ",":
+            reader.pos += 1
+            continue
+        reader.expect("}")
+        return
+
+
+def iter_json_array(f: TextIO, chunk_size: int=1<<20) -> Iterator[Any]:
+    '''yield the elements of a top level json list one at a time, like iter_json_object.'''
+    reader = _IncrementalReader(f, chunk_size)
+    reader.expect("[")
+    if reader.peek() == "]":
+        return
+    while True:
+        yield reader.value()
+        if reader.peek() == ",":
+            reader.pos += 1
+            continue
+        reader.expect("]")
+        return
+
+
+class JSONListWriter:
+    '''writes a json list one element at a time, formatted exactly like json.dumps(items, indent=indent).'''
+    def __init__(self, f: TextIO, indent: int=4, ensure_ascii: bool=False):
+        self.f = f
+        self.indent = indent
+        self.ensure_ascii = ensure_ascii
+        self.count = 0
+
+    def write(self, item: Any):
+        text = json.dumps(item, ensure_ascii=self.ensure_ascii, indent=self.indent)
+        if self.indent is None:
+            self.f.write(("[" if self.count == 0 else ", ") + text)
+            self.count += 1
+            return
+        prefix = " " * self.indent
+        self.f.write(("[\n" if self.count == 0 else ",\n") + "\n".join(prefix + line for line in text.split("\n")))
+        self.count += 1
+
+    def close(self):
+        if self.count == 0:
+            self.f.write("[]")
+        else:
+            self.f.write("]" if self.indent is None else "\n]")
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# process-wide pool of twitter guest tokens.
+import os
+import json
+import time
+import asyncio
+import pathlib
+import weakref
+import threading
+from typing import Union, Callable, Awaitable, Optional
+
+# guest tokens are handed out with `Max-Age=10800`.
+GUEST_TOKEN_TTL = 10800
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "yats", "guest_tokens.json")
+
+
+class GuestTokenPool:
+    '''
+    Shares guest tokens between all scrapers of a process (and between runs, through a small json file).
+    Up to `size` tokens are kept and handed out round robin. When a token gets blocked every scraper
+    that used it reports it through `invalidate`, but only one of them fetches the replacement.
+    '''
+    def __init__(self, size: int=1, path: Union[str, pathlib.Path, None]=DEFAULT_CACHE_PATH, ttl: float=GUEST_TOKEN_TTL):
+        self.size = size
+        self.path = path
+        self.ttl = ttl
+        self._tokens = {} # token -> expiry (unix time).
+        self._next = 0
+        self._lock = threading.Lock() # guards _tokens.
+        self._fetch_lock = threading.Lock() # only one thread fetches a token at a time.
+        self._async_fetch_locks = weakref.WeakKeyDictionary() # event loop -> asyncio.Lock, same purpose for coroutines.
+        self._load()
+
+    def __len__(self):
+        with self._lock:
+            self._prune()
+            return len(self._tokens)
+
+    def _prune(self):
+        now = time.time()
+        for token, expiry in list(self._tokens.items()):
+            if expiry <= now:
+                del self._tokens[token]
+
+    def _load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                self._tokens = {token: float(expiry) for token, expiry in json.load(f).items()}
+        except (OSError, ValueError, AttributeError):
+            # a broken cache only costs a token refresh.
+            self._tokens = {}
+        self._prune()
+
+    def _save(self):
+        '''write the cache atomically. called with _lock held.'''
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._tokens, f)
+        os.replace(tmp_path, self.path)
+
+    def _pick(self) -> Optional[str]:
+        '''rotate through valid tokens once the pool is full. called with _lock held.'''
+        self._prune()
+        if len(self._tokens) < self.size:
+            return None
+        tokens = sorted(self._tokens)
+        token = tokens[self._next % len(tokens)]
+        self._next += 1
+        return token
+
+    def _add(self, token: str):
+        with self._lock:
+            self._tokens[token] = time.time() + self.ttl
+            self._save()
+
+    def expiry(self, token: str) -> Optional[float]:
+        '''unix time at which `token` expires, None if it isn't in the pool.'''
+        with self._lock:
+            return self._tokens.get(token)
+
+    def get(self, fetch: Callable[[], str]) -> str:
+        '''return a pooled token, calling `fetch` to retrieve a new one if the pool isn't full yet.'''
+        with self._lock:
+            token = self._pick()
+        if token is not None:
+            return token
+        with self._fetch_lock:
+            # another thread may have filled the pool while we were waiting.
+            with self._lock:
+                token = self._pick()
+            if token is not None:
+                return token
+            token = fetch()
+            self._add(token)
+        return token
+
+    async def aget(self, fetch: Callable[[], Awaitable[str]]) -> str:
+        '''asyncio variant of get; `fetch` is a coroutine function.'''
+        with self._lock:
+            token = self._pick()
+        if token is not None:
+            return token
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            fetch_lock = self._async_fetch_locks.setdefault(loop, asyncio.Lock())
+        async with fetch_lock:
+            with self._lock:
+                token = self._pick()
+            if token is not None:
+                return token
+            token = await fetch()
+            self._add(token)
+        return token
+
+    def invalidate(self, token: str):
+        '''drop a blocked/expired token. invalidating a token that was already dropped is a no-op.'''
+        with self._lock:
+            if self._tokens.pop(token, None) is not None:
+                self._save()
+
+    def clear(self):
+        with self._lock:
+            self._tokens = {}
+            self._save()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+def default_pool() -> GuestTokenPool:
+    '''the pool shared by all scrapers that weren't given one explicitly.'''
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = GuestTokenPool()
+        return _default_pool
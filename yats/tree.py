@@ -1,9 +1,24 @@
 # import dataclasses
+import io
 import os
-from typing import Union, List
+import json
+from xml.sax.saxutils import escape, quoteattr
+from typing import Union, List, Iterator, TextIO
+try:
+    from .stream import iter_json_array
+except ImportError:
+    from yats.stream import iter_json_array
 
 
 class ConversationTreeNode:
+    # subtree statistics, set by compute_tree_stats (buildTree(data, stats=True)). the class level values are
+    # those of an isolated node, so trees built without statistics don't carry them per node.
+    size = 1 # number of nodes in the subtree.
+    fanout = 0 # number of (fetched) children.
+    missingReplies = 0 # replies reported by reply_count that weren't fetched.
+    leaves = None # leaves of the whole tree in depth first order, shared by its nodes.
+    leafRange = (0, 1) # the leaves below this node are leaves[leafRange[0]:leafRange[1]].
+
     def __init__(self, payload: dict):
         # each isolated node has zero depth.
         self.depth = 0 # the length of the path from the root.
@@ -60,19 +75,23 @@ class ConversationTreeNode:
 ++---------------------++'''
 
     def toXML(self):
-        childContent = '\n'.join(child.toXML() for child in self)
-        op = f'''
-<node isRoot="{self.isRoot}" isLeaf="{self.isLeaf}" height="{self.height}" depth="{self.depth}">
-    {self.payload}
-    {childContent}
-</node>'''
-        
-        return op.strip().strip("\n")
+        '''the subtree as an xml document (see write_tree, which streams it to a file instead).'''
+        f = io.StringIO()
+        write_tree(self, f, format="xml")
+        return f.getvalue().rstrip("\n")
 
     def __iter__(self):
         for child in self.children:
             yield child
 
+    def leafSet(self):
+        '''the nodes without (fetched) children below this node, in depth first order.'''
+        if self.leaves is None:
+            if self.children:
+                raise ValueError("leaf ranges aren't computed, see compute_tree_stats or buildTree(data, stats=True)")
+            return [self]
+        return self.leaves[self.leafRange[0]:self.leafRange[1]]
+
     def append(self, child):
         '''add child node. since this node has a child it can't be a leaf'''
         self.isLeaf = False 
@@ -130,10 +149,10 @@ class SnscrapeConversationTreeNode(ConversationTreeNode):
         return [utterance("text") for utterance in conversation]
 
     def pathToRoot(self):
-        if not self.isRoot:
-            return [self] + self.parent.pathToRoot()
-        else:
-            return [self]
+        path = [self]
+        while not path[-1].isRoot:
+            path.append(path[-1].parent)
+        return path
 
     def __str__(self):
         payload_byte_size = len(
@@ -156,7 +175,9 @@ class SnscrapeConversationTreeNode(ConversationTreeNode):
 '''
 
 
-def buildTree(data):
+def buildTree(data, stats: bool=False):
+    '''the nodes of the reply trees of `data`, by tweet id. with stats the subtree statistics of every node are
+    computed as well (see compute_tree_stats).'''
     nodes = {}
     # build dict of nodes.
     for item in data:
@@ -171,9 +192,147 @@ def buildTree(data):
         if parent_id:
             parent = nodes[parent_id] 
             parent.append(node)
+    # append only updates the direct parent, fix up the statistics of the whole trees.
+    if stats:
+        compute_tree_stats(nodes)
 
     return nodes
 
+def compute_tree_stats(nodes):
+    '''recompute depth, height, size, fanout, missingReplies and the leaf ranges of every node of the trees in
+    `nodes` (e.g. built by buildTree), iteratively and in O(n). unlike the values kept by append they don't
+    depend on the order in which the nodes were attached. leaves here are the nodes without fetched children,
+    not isLeaf (which SnscrapeConversationTreeNode bases on reply_count).'''
+    for root in nodes.values():
+        if not root.isRoot: continue
+        leaves = []
+        order = [] # pre-order: every subtree is contiguous, and its leaves are contiguous in `leaves`.
+        root.depth = 0
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            node.leaves = leaves
+            node.leafRange = (len(leaves), len(leaves))
+            if not node.children:
+                leaves.append(node)
+            for child in reversed(node.children):
+                child.depth = node.depth + 1
+                stack.append(child)
+        # children before parents.
+        for node in reversed(order):
+            node.fanout = len(node.children)
+            node.missingReplies = max(0, int(node.payload.get("reply_count") or 0) - node.fanout)
+            if not node.children:
+                node.size, node.height = 1, 0
+                node.leafRange = (node.leafRange[0], node.leafRange[0] + 1)
+                continue
+            node.size = 1 + sum(child.size for child in node.children)
+            node.height = 1 + max(child.height for child in node.children)
+            node.leafRange = (node.leafRange[0], node.children[-1].leafRange[1])
+
+def iter_dialogues(nodes, key="text"):
+    '''yield the root to leaf dialogues (lists of payload[key]) of the trees built by buildTree.
+    each tree is walked once, depth first and without recursion, keeping the current root to node path on a stack,
+    so shared ancestors aren't revisited for every leaf.'''
+    for root in nodes.values():
+        if not root.isRoot: continue
+        path = []
+        stack = [(root, 0)] # (node, depth)
+        while stack:
+            node, depth = stack.pop()
+            del path[depth:]
+            path.append(node(key))
+            if node.isLeaf:
+                yield list(path)
+            stack.extend((child, depth+1) for child in reversed(node.children))
+
+def dialogue_trie(nodes, key="text", min_length=2):
+    '''the dialogues of iter_dialogues (with at least `min_length` utterances) as a prefix trie:
+        utterances: [parent index (-1 for a root), payload[key]], every utterance on a dialogue stored once.
+        dialogues: index of the last utterance of every dialogue, in iter_dialogues order.
+    parents are always stored before their children.'''
+    utterances, dialogues = [], []
+    for root in nodes.values():
+        if not root.isRoot: continue
+        path = [] # [payload[key], utterance index or None] from the root to the current node.
+        stored = 0 # path[:stored] are stored already.
+        stack = [(root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            del path[depth:]
+            stored = min(stored, depth)
+            path.append([node(key), None])
+            if node.isLeaf and len(path) >= min_length:
+                for entry in path[stored:]:
+                    entry[1] = len(utterances)
+                    utterances.append([path[stored-1][1] if stored else -1, entry[0]])
+                    stored += 1
+                dialogues.append(path[-1][1])
+            stack.extend((child, depth+1) for child in reversed(node.children))
+
+    return {"utterances": utterances, "dialogues": dialogues}
+
+def expand_dialogue_trie(trie) -> Iterator[list]:
+    '''the flat dialogues (root to leaf lists) of a dialogue_trie.'''
+    utterances = trie["utterances"]
+    for leaf in trie["dialogues"]:
+        dialogue = []
+        while leaf != -1:
+            parent, text = utterances[leaf]
+            dialogue.append(text)
+            leaf = parent
+        yield dialogue[::-1]
+
+def iter_extracted_dialogues(path) -> Iterator[list]:
+    '''stream the flat dialogues of a file written by extract_dialogues, in either format
+    (a list of dialogues, or a list of per conversation dialogue tries).'''
+    with open(path, encoding="utf-8") as f:
+        for item in iter_json_array(f):
+            if isinstance(item, dict):
+                yield from expand_dialogue_trie(item)
+            else:
+                yield item
+
+def _node_attributes(node) -> dict:
+    return {"isRoot": node.isRoot, "isLeaf": node.isLeaf, "height": node.height, "depth": node.depth}
+
+def write_tree(node, f: TextIO, format: str="xml", indent: int=4):
+    '''write the subtree of `node` to the file-like `f`, as nested <node> elements (format="xml") or nested
+    {..., "payload": ..., "children": [...]} objects on one line (format="json").
+    the tree is walked iteratively and written as it goes, so memory only grows with the depth/width of the
+    stack, not with the size of the output. xml payloads are json, escaped as element text.
+    height and depth are those of compute_tree_stats, which is run on the whole tree first if it wasn't yet.'''
+    if format not in ("xml", "json"):
+        raise ValueError(f"format should be 'xml' or 'json', got {format!r}")
+    if node.leaves is None:
+        # the values kept by append/parent are only right for trees attached top down.
+        root = node
+        while root.parent is not None:
+            root = root.parent
+        compute_tree_stats({id(root): root})
+    # (node, level, False) writes a node, (node, level, True) closes it once its children are written.
+    # children are pushed in reverse so that they come out in order.
+    stack = [(node, 0, False)]
+    first = True # no separator before the first child of a json node.
+    while stack:
+        node, level, closing = stack.pop()
+        prefix = " " * (indent * level) if format == "xml" and indent else ""
+        if closing:
+            f.write(f"{prefix}</node>\n" if format == "xml" else "]}")
+            first = False
+            continue
+        attributes = _node_attributes(node)
+        payload = json.dumps(node.payload, ensure_ascii=False)
+        if format == "xml":
+            attributes = " ".join(f"{key}={quoteattr(str(value))}" for key, value in attributes.items())
+            f.write(f"{prefix}<node {attributes}>\n{prefix}{' ' * (indent or 0)}<payload>{escape(payload)}</payload>\n")
+        else:
+            f.write(("" if first else ", ") + f'{{{json.dumps(attributes)[1:-1]}, "payload": {payload}, "children": [')
+            first = True
+        stack.append((node, level, True))
+        stack.extend((child, level + 1, False) for child in reversed(node.children))
+
 def printTree(node, prefix=""):
     node.pprint(prefix)
     if node.isLeaf:
@@ -1,3 +1,8 @@
+import datetime
+import functools
+import email.utils
+
+
 def get_version():
     import sys
     version = sys.version.split()[0]
@@ -16,11 +21,86 @@ def datestr_to_datedict(date):
     import json
     return json.loads(date)
 
+_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+_MONTH_NUMBERS = {month: i+1 for i, month in enumerate(_MONTHS)}
+_TIMEZONES = {} # "+0000" -> tzinfo
+
+def _utc_offset(date):
+    # same as strftime("%z").
+    offset = date.utcoffset()
+    if offset is None:
+        return ""
+    if offset.seconds % 60 or offset.microseconds:
+        return date.strftime("%z")
+    minutes = offset.days * 1440 + offset.seconds // 60
+    sign = "-" if minutes < 0 else "+"
+    return f"{sign}{abs(minutes) // 60:02d}{abs(minutes) % 60:02d}"
+
 def datetime_to_datedict(date):
-    datestr = datetime_to_datestr(date)
-    datedict = datestr_to_datedict(datestr)
+    '''the same dict as datestr_to_datedict(datetime_to_datestr(date)), built directly.'''
+    if not date:
+        return {"date": "00 Xxx 0000", "time": "00:00:00 AM", "utc_offset": "+0000"}
+    return {
+        "date": f"{date.day:02d} {_MONTHS[date.month-1]} {date.year}",
+        "time": f"{date.hour % 12 or 12:02d}:{date.minute:02d}:{date.second:02d} {'AM' if date.hour < 12 else 'PM'}",
+        "utc_offset": _utc_offset(date),
+    }
+
+def datetime_to_epoch(date):
+    '''compact date representation: unix time in seconds, None if the date isn't known.'''
+    if not date:
+        return None
+    return int(date.timestamp())
+
+def datedict_to_epoch(date):
+    '''unix time of a dict made by datetime_to_datedict, None for the placeholder of unknown dates.'''
+    day, month, year = date["date"].split(" ")
+    if month not in _MONTH_NUMBERS:
+        return None
+    clock, meridiem = date["time"].split(" ")
+    hour, minute, second = (int(part) for part in clock.split(":"))
+    hour = hour % 12 + (12 if meridiem == "PM" else 0)
+    offset = date["utc_offset"]
+    minutes = (int(offset[1:3]) * 60 + int(offset[3:5])) * (-1 if offset[0] == "-" else 1) if offset else 0
+    local = datetime.datetime(int(year), _MONTH_NUMBERS[month], int(day), hour, minute, second, tzinfo=datetime.timezone.utc)
+    return int((local - datetime.timedelta(minutes=minutes)).timestamp())
+
+def _split_created_at(created_at):
+    '''the parts of twitter's fixed created_at format ("Sat Oct 16 08:34:04 +0000 2021"), None if it doesn't match.'''
+    parts = created_at.split(" ")
+    if len(parts) != 6 or parts[1] not in _MONTH_NUMBERS or len(parts[3]) != 8 or len(parts[4]) != 5 or parts[4][0] not in "+-" or parts[4] == "-0000":
+        return None
+    _, month, day, clock, offset, year = parts
+    return int(year), month, int(day), int(clock[:2]), clock[3:5], clock[6:8], offset
+
+def parse_created_at(created_at):
+    '''datetime of a twitter created_at string, equal to email.utils.parsedate_to_datetime(created_at).'''
+    parts = _split_created_at(created_at)
+    if parts is None:
+        return email.utils.parsedate_to_datetime(created_at)
+    year, month, day, hour, minute, second, offset = parts
+    if offset not in _TIMEZONES:
+        minutes = int(offset[1:3]) * 60 + int(offset[3:5])
+        _TIMEZONES[offset] = datetime.timezone(datetime.timedelta(minutes=-minutes if offset[0] == "-" else minutes))
+    return datetime.datetime(year, _MONTH_NUMBERS[month], day, hour, int(minute), int(second), tzinfo=_TIMEZONES[offset])
+
+def created_at_to_datedict(created_at):
+    '''datetime_to_datedict(parse_created_at(created_at)), without building the datetime.'''
+    parts = _split_created_at(created_at)
+    if parts is None:
+        return datetime_to_datedict(parse_created_at(created_at))
+    year, month, day, hour, minute, second, offset = parts
+    return {
+        "date": f"{day:02d} {month} {year}",
+        "time": f"{hour % 12 or 12:02d}:{minute}:{second} {'AM' if hour < 12 else 'PM'}",
+        "utc_offset": offset,
+    }
+
+def created_at_to_epoch(created_at):
+    return datetime_to_epoch(parse_created_at(created_at))
 
-    return datedict
+# users show up on many pages, their creation dates are cached (datetimes are immutable).
+cached_parse_created_at = functools.lru_cache(maxsize=2**16)(parse_created_at)
 
 def get_platform():
     import platform